@@ -0,0 +1,124 @@
+import asyncio
+import contextvars
+import copy
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+
+from .instrumentation import current_probe, execute_wrappers
+
+# Routes served by pooled views under ASGI: recipe reads and writes, the
+# feed and the ingredient search, the shopping list download and image
+# uploads.
+POOLED_ROUTES = (
+    'recipes-list',
+    'recipes-detail',
+    'recipes-feed',
+    'recipes-cook',
+    'recipes-download-shopping-cart',
+    'recipes-upload-image',
+    'ingredients-list',
+    'ingredients-detail',
+    'tags-list',
+    'tags-detail',
+    'subscriptions',
+)
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_VIEW_WORKERS', 16),
+    thread_name_prefix='async-views',
+)
+
+
+def respond(view, request, *args, **kwargs):
+    """Run a sync view to a complete response in a pool thread.
+
+    Rendering happens here as well. A streamed body is marked ``pooled``
+    and left lazy: ``PooledASGIHandler`` produces its chunks in the pool
+    one at a time, so views must read their rows before returning. The
+    request's instrumentation probe, if any, is hooked to this thread's
+    connections, which the middleware cannot see.
+    """
+    close_old_connections()
+    try:
+        with execute_wrappers(current_probe.get()):
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                response.render()
+            if response.streaming:
+                response.pooled = True
+        return response
+    finally:
+        close_old_connections()
+
+
+async def pooled_chunks(chunks):
+    """Yield the chunks of a streamed body, each produced in the pool."""
+    loop = asyncio.get_running_loop()
+    iterator = iter(chunks)
+    while True:
+        chunk = await loop.run_in_executor(executor, next, iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class PooledASGIHandler(ASGIHandler):
+    """ASGI handler that streams ``pooled`` bodies from the thread pool.
+
+    Django 3.2 iterates a streamed body on the event loop, which would
+    block it for as long as a PDF takes to lay out.
+    """
+
+    async def send_response(self, response, send):
+        if not getattr(response, 'pooled', False):
+            await super().send_response(response, send)
+            return
+        chunks = response.streaming_content
+        response.streaming_content = ()
+
+        async def send_with_body(message):
+            # The closing message follows the (now empty) body.
+            if (message['type'] == 'http.response.body'
+                    and not message.get('more_body')):
+                async for chunk in pooled_chunks(chunks):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            await send(message)
+
+        await super().send_response(response, send_with_body)
+
+
+def pooled_view(view):
+    """Wrap a sync view into an async view served by the thread pool.
+
+    Django 3.2 runs every sync view of an ASGI server on one shared
+    thread; the pool lets up to ``ASYNC_VIEW_WORKERS`` requests wait on
+    the database and the media storage at the same time while the event
+    loop keeps accepting connections and reading request bodies.
+    """
+    @functools.wraps(view)
+    async def pooled(request, *args, **kwargs):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, functools.partial(
+                context.run, respond, view, request, *args, **kwargs))
+
+    return pooled
+
+
+def pooled_patterns(patterns, names=POOLED_ROUTES):
+    """Return ``patterns`` with the named routes served by pooled views."""
+    result = []
+    for pattern in patterns:
+        if getattr(pattern, 'name', None) in names:
+            pattern = copy.copy(pattern)
+            pattern.callback = pooled_view(pattern.callback)
+        result.append(pattern)
+    return result
@@ -0,0 +1,358 @@
+import base64
+import platform
+import shutil
+import statistics
+import time
+import tracemalloc
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from unittest import mock
+from urllib.parse import quote, urlencode
+
+import django
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from recipes.models import (Follow, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListExport, Tag)
+from rest_framework.test import APIClient
+from users.models import User
+
+from .cache import RANKING_NAMESPACES, RECIPE_NAMESPACES, bump_version
+from .exporters import PdfExporter
+from .exports import render_pdf
+from .images import UPLOAD_SALT
+from .instrumentation import percentile
+
+PASSWORD = 'synthetic-password'
+# 1×1 PNG used by the create and upload scenarios.
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA'
+    '60e6kgAAAABJRU5ErkJggg=='
+)
+DATA_URI = 'data:image/png;base64,' + base64.b64encode(PNG).decode()
+# Versions of every cached response; runs of scenarios that are not
+# marked cached start on new ones, so they measure the views themselves.
+CACHE_NAMESPACES = RECIPE_NAMESPACES + RANKING_NAMESPACES
+# Position of the deep page scenarios, capped by the number of recipes.
+DEEP_OFFSET = 2000
+PAGE_SIZE = 6
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    url: Callable
+    data: Optional[Callable] = None
+    authenticated: bool = True
+    format: str = 'json'
+    headers: dict = field(default_factory=dict)
+    cleanup: Optional[Callable] = None
+    cached: bool = False
+    # Returns a context manager the request runs in.
+    patch: Optional[Callable] = None
+    # Executable the scenario needs; it is skipped when not installed.
+    requires: Optional[str] = None
+
+    def available(self):
+        return not self.requires or shutil.which(self.requires) is not None
+
+
+class Context:
+    """Rows the scenarios point at, picked once from the benchmark data."""
+
+    def __init__(self, user):
+        self.user = user
+        self.own_recipe = Recipe.objects.filter(author=user).first()
+        self.recipe = Recipe.objects.exclude(author=user).order_by(
+            '-favorites_count', 'id').first()
+        if self.own_recipe is None or self.recipe is None:
+            raise ValueError(
+                'Нужны рецепты пользователя и других авторов: '
+                'запустите seed_synthetic')
+        self.followed = Follow.objects.filter(user=user).values_list(
+            'author_id', flat=True).first()
+        self.stranger = User.objects.exclude(pk=user.pk).exclude(
+            follower__user=user).values_list('id', flat=True).first()
+        self.tag = Tag.objects.values_list('slug', 'id').first()
+        self.ingredients = list(
+            self.own_recipe.ingredient_number.values_list(
+                'ingredient_id', flat=True))
+        self.ingredient = Ingredient.objects.values_list(
+            'id', 'name').first()
+        self.in_cart = ShoppingCart.objects.filter(user=user).values_list(
+            'recipe_id', flat=True).first()
+        self.deep_offset = max(
+            min(DEEP_OFFSET, Recipe.objects.count() - PAGE_SIZE), 0)
+        # A cursor page as deep into the newest-first order of the cursor.
+        position = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True)[self.deep_offset:self.deep_offset + 1]
+        self.deep_cursor = cursor_token(
+            position[0] + 1 if position else 0)
+        self.export = ShoppingListExport.objects.create(
+            user=user, digest='benchmark', status=ShoppingListExport.DONE,
+            file='shopping_lists/benchmark.pdf', updated=timezone.now())
+
+
+def cursor_token(position):
+    # The token CursorPagination.encode_cursor builds for a first visit.
+    return quote(base64.b64encode(urlencode({'p': position}).encode()))
+
+
+def recipe_payload(context):
+    return {
+        'name': 'Бенчмарк',
+        'text': 'Рецепт для бенчмарка',
+        'cooking_time': 10,
+        'image': DATA_URI,
+        'tags': [context.tag[1]],
+        'ingredients': [
+            {'id': pk, 'amount': 5} for pk in context.ingredients[:5]],
+    }
+
+
+def wkhtmltopdf_stream(exporter, rows):
+    yield render_pdf(list(rows))
+
+
+def remove_upload(response):
+    token = response.data.get('token') if response.data else None
+    if token:
+        default_storage.delete(signing.loads(token, salt=UPLOAD_SALT)['path'])
+
+
+def remove_created_image(response):
+    image = response.data.get('image') if response.data else None
+    if image:
+        name = image.split(default_storage.base_url, 1)[-1]
+        default_storage.delete(name)
+
+
+SCENARIOS = (
+    Scenario('api root', 'get', lambda c: '/api/'),
+    Scenario('recipes list', 'get', lambda c: '/api/recipes/?limit=6',
+             authenticated=False),
+    Scenario('recipes list, authenticated', 'get',
+             lambda c: '/api/recipes/?limit=6'),
+    Scenario('recipes list, cursor', 'get',
+             lambda c: '/api/recipes/?limit=6&pagination=cursor'),
+    Scenario('recipes list, deep offset', 'get',
+             lambda c: f'/api/recipes/?limit={PAGE_SIZE}'
+             f'&offset={c.deep_offset}'),
+    Scenario('recipes list, deep cursor', 'get',
+             lambda c: f'/api/recipes/?limit={PAGE_SIZE}'
+             f'&cursor={c.deep_cursor}'),
+    Scenario('recipes list, tag filter', 'get',
+             lambda c: f'/api/recipes/?limit=6&tags={c.tag[0]}'),
+    Scenario('recipes list, favorites', 'get',
+             lambda c: '/api/recipes/?limit=6&is_favorited=1'),
+    Scenario('recipes list, shopping cart', 'get',
+             lambda c: '/api/recipes/?limit=6&is_in_shopping_cart=1'),
+    Scenario('recipes list, author', 'get',
+             lambda c: f'/api/recipes/?limit=6&author={c.user.id}'),
+    Scenario('recipes list, search', 'get',
+             lambda c: f'/api/recipes/?limit=6&search={quote("суп")}'),
+    Scenario('recipes list, popular', 'get',
+             lambda c: '/api/recipes/?limit=6&ordering=popular'),
+    Scenario('recipes list, trending, cursor', 'get',
+             lambda c: '/api/recipes/?limit=6&ordering=trending'
+             '&pagination=cursor'),
+    Scenario('recipe retrieve', 'get',
+             lambda c: f'/api/recipes/{c.recipe.id}/'),
+    Scenario('recipes list, cached', 'get',
+             lambda c: '/api/recipes/?limit=6', cached=True),
+    Scenario('recipe retrieve, cached', 'get',
+             lambda c: f'/api/recipes/{c.recipe.id}/', cached=True),
+    Scenario('recipe create', 'post', lambda c: '/api/recipes/',
+             data=recipe_payload, cleanup=remove_created_image),
+    Scenario('recipe update', 'patch',
+             lambda c: f'/api/recipes/{c.own_recipe.id}/',
+             data=recipe_payload, cleanup=remove_created_image),
+    Scenario('recipe delete', 'delete',
+             lambda c: f'/api/recipes/{c.own_recipe.id}/'),
+    Scenario('favorite add', 'post',
+             lambda c: f'/api/recipes/{c.recipe.id}/favorite/'),
+    Scenario('shopping cart add', 'post',
+             lambda c: f'/api/recipes/{c.recipe.id}/shopping_cart/'),
+    Scenario('shopping cart remove', 'delete',
+             lambda c: f'/api/recipes/{c.in_cart}/shopping_cart/'),
+    Scenario('image upload', 'post', lambda c: '/api/recipes/upload_image/',
+             data=lambda c: {'image': SimpleUploadedFile(
+                 'benchmark.png', PNG, 'image/png')},
+             format='multipart', cleanup=remove_upload),
+    Scenario('shopping list, text', 'get',
+             lambda c: '/api/recipes/download_shopping_cart/',
+             headers={'HTTP_ACCEPT': 'text/plain'}),
+    Scenario('shopping list, pdf', 'get',
+             lambda c: '/api/recipes/download_shopping_cart/',
+             headers={'HTTP_ACCEPT': 'application/pdf'}),
+    # The rendering the in-process PDF writer replaced, for comparison.
+    Scenario('shopping list, wkhtmltopdf', 'get',
+             lambda c: '/api/recipes/download_shopping_cart/',
+             headers={'HTTP_ACCEPT': 'application/pdf'},
+             patch=lambda: mock.patch.object(
+                 PdfExporter, 'stream', wkhtmltopdf_stream),
+             requires='wkhtmltopdf'),
+    Scenario('shopping list export status', 'get',
+             lambda c: f'/api/recipes/shopping_cart_export/{c.export.id}/'),
+    Scenario('what can I cook', 'get',
+             lambda c: '/api/recipes/cook/?limit=6&ingredients='
+             + ','.join(map(str, c.ingredients))),
+    Scenario('feed', 'get', lambda c: '/api/recipes/feed/?limit=6'),
+    Scenario('ingredients list', 'get', lambda c: '/api/ingredients/',
+             authenticated=False),
+    Scenario('ingredients search', 'get',
+             lambda c: '/api/ingredients/?name=' + quote(c.ingredient[1][:3]),
+             authenticated=False),
+    Scenario('ingredient retrieve', 'get',
+             lambda c: f'/api/ingredients/{c.ingredient[0]}/',
+             authenticated=False),
+    Scenario('tags list', 'get', lambda c: '/api/tags/',
+             authenticated=False),
+    Scenario('tags list, cached', 'get', lambda c: '/api/tags/',
+             authenticated=False, cached=True),
+    Scenario('tag retrieve', 'get', lambda c: f'/api/tags/{c.tag[1]}/',
+             authenticated=False),
+    Scenario('metrics', 'get', lambda c: '/api/metrics/'),
+    Scenario('token login', 'post', lambda c: '/api/auth/token/login/',
+             data=lambda c: {'email': c.user.email, 'password': PASSWORD},
+             authenticated=False),
+    Scenario('token logout', 'post', lambda c: '/api/auth/token/logout/'),
+    Scenario('users list', 'get', lambda c: '/api/users/?limit=6'),
+    Scenario('user create', 'post', lambda c: '/api/users/',
+             data=lambda c: {
+                 'email': 'benchmark@example.com', 'username': 'benchmark',
+                 'first_name': 'Bench', 'last_name': 'Mark',
+                 'password': 'Benchmark-password-1',
+             }, authenticated=False),
+    Scenario('user retrieve', 'get',
+             lambda c: f'/api/users/{c.recipe.author_id}/'),
+    Scenario('user me', 'get', lambda c: '/api/users/me/'),
+    Scenario('set password', 'post', lambda c: '/api/users/set_password/',
+             data=lambda c: {
+                 'current_password': PASSWORD,
+                 'new_password': 'Benchmark-password-2',
+             }),
+    Scenario('subscriptions', 'get',
+             lambda c: '/api/users/subscriptions/?recipes_limit=3'),
+    Scenario('subscribe', 'post',
+             lambda c: f'/api/users/{c.stranger}/subscribe/'),
+    Scenario('unsubscribe', 'delete',
+             lambda c: f'/api/users/{c.followed}/subscribe/'),
+    # Runs last: it queues a PDF rendering in the background.
+    Scenario('shopping list export', 'post',
+             lambda c: '/api/recipes/shopping_cart_export/'),
+)
+
+
+def request(client, scenario, context):
+    kwargs = dict(scenario.headers)
+    if scenario.data is not None:
+        kwargs['data'] = scenario.data(context)
+        kwargs['format'] = scenario.format
+    response = getattr(client, scenario.method)(
+        scenario.url(context), **kwargs)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def run_once(client, scenario, context):
+    """Run the scenario in a transaction that is rolled back afterwards."""
+    if scenario.authenticated:
+        # A fresh copy: views such as set_password change the instance.
+        client.force_authenticate(User.objects.get(pk=context.user.pk))
+    if not scenario.cached:
+        for namespace in CACHE_NAMESPACES:
+            bump_version(namespace)
+    with transaction.atomic():
+        started = time.perf_counter()
+        patch = scenario.patch() if scenario.patch else nullcontext()
+        with patch, CaptureQueriesContext(connection) as queries:
+            response = request(client, scenario, context)
+        elapsed = time.perf_counter() - started
+        transaction.set_rollback(True)
+    if scenario.cleanup is not None:
+        scenario.cleanup(response)
+    return response, elapsed, queries.captured_queries
+
+
+def run_scenario(scenario, context, iterations, warmup=2):
+    client = APIClient(raise_request_exception=False)
+    for _ in range(warmup):
+        response, _, _ = run_once(client, scenario, context)
+    timings, query_counts = [], []
+    for _ in range(iterations):
+        response, elapsed, queries = run_once(client, scenario, context)
+        timings.append(elapsed)
+        query_counts.append(len(queries))
+    tracemalloc.start()
+    try:
+        run_once(client, scenario, context)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'status': response.status_code,
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'min_ms': round(min(timings) * 1000, 3),
+        'queries': max(query_counts),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run(user, iterations, names=None):
+    with transaction.atomic():
+        context = Context(user)
+        results = {}
+        for scenario in SCENARIOS:
+            if names and scenario.name not in names:
+                continue
+            if not scenario.available():
+                continue
+            results[scenario.name] = run_scenario(
+                scenario, context, iterations)
+        transaction.set_rollback(True)
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'rows': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Yield ``(name, metric, baseline, current, regressed)`` per metric."""
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        yield (
+            name, 'median_ms', previous['median_ms'], current['median_ms'],
+            current['median_ms'] > previous['median_ms'] * (1 + threshold),
+        )
+        yield (
+            name, 'queries', previous['queries'], current['queries'],
+            current['queries'] > previous['queries'],
+        )
+        yield (
+            name, 'peak_memory_kb', previous['peak_memory_kb'],
+            current['peak_memory_kb'],
+            current['peak_memory_kb']
+            > previous['peak_memory_kb'] * (1 + threshold),
+        )
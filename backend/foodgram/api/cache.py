@@ -0,0 +1,215 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from recipes.models import Recipe
+
+from .relations import relation_cache
+from .renderers import FastJSONRenderer
+
+CACHE_TIMEOUT = getattr(settings, 'REFERENCE_CACHE_TIMEOUT', 60 * 60)
+RECIPE_CACHE_TIMEOUT = getattr(settings, 'RECIPE_CACHE_TIMEOUT', 10 * 60)
+# Everything a cached recipe payload is built from, besides the recipe.
+RECIPE_NAMESPACES = ('recipes', 'tags', 'ingredients', 'users')
+# Detail pages leave out 'recipes': edits to the recipe itself move its
+# updated_at, which is part of the key.
+RECIPE_DETAIL_NAMESPACES = ('tags', 'ingredients', 'users')
+# Bumped by recompute_trending; only ranked pages depend on it.
+RANKING_NAMESPACES = ('rankings',)
+
+
+def get_version(namespace):
+    return cache.get_or_set(f'{namespace}:version', 1, None)
+
+
+def get_versions(namespaces):
+    keys = [f'{namespace}:version' for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, 1, None)
+            versions[key] = cache.get(key, 1)
+    return ':'.join(str(versions[key]) for key in keys)
+
+
+def bump_version(namespace):
+    try:
+        cache.incr(f'{namespace}:version')
+    except ValueError:
+        cache.set(f'{namespace}:version', 1, None)
+
+
+def make_etag(content):
+    return quote_etag(hashlib.sha1(content).hexdigest())
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+class CachedResponseMixin:
+    """Serve list and retrieve from pre-rendered JSON with strong ETags.
+
+    Entries are keyed by ``cache_namespace``, its current version and the
+    full request path, so bumping the version drops every cached page.
+    """
+
+    cache_namespace = None
+
+    def cached_response(self, request, build):
+        if request.accepted_renderer.format != 'json':
+            return build()
+        version = get_version(self.cache_namespace)
+        key = (
+            f'{self.cache_namespace}:{version}:{request.get_full_path()}'
+        )
+        entry = cache.get(key)
+        if entry is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            content = FastJSONRenderer().render(response.data)
+            entry = (content, make_etag(content))
+            cache.set(key, entry, CACHE_TIMEOUT)
+        content, etag = entry
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                content, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).retrieve(
+                request, *args, **kwargs))
+
+
+def recipe_payloads(data):
+    if 'results' in data:
+        return data['results']
+    return [data]
+
+
+def clear_user_flags(data):
+    for recipe in recipe_payloads(data):
+        recipe['is_favorited'] = False
+        recipe['is_in_shopping_cart'] = False
+        recipe['author']['is_subscribed'] = False
+
+
+def overlay_user_flags(data, request):
+    """Set the flags of ``request.user`` on a cached payload.
+
+    Returns the flags as a string of digits, which is enough to tell the
+    user's variants of one payload apart in the ETag.
+    """
+    favorites = relation_cache.members(request, 'favorite')
+    cart = relation_cache.members(request, 'shopping_cart')
+    following = relation_cache.members(request, 'following')
+    flags = []
+    for recipe in recipe_payloads(data):
+        recipe['is_favorited'] = recipe['id'] in favorites
+        recipe['is_in_shopping_cart'] = recipe['id'] in cart
+        author = recipe['author']
+        author['is_subscribed'] = author['id'] in following
+        flags.append(
+            f'{recipe["is_favorited"]:d}{recipe["is_in_shopping_cart"]:d}'
+            f'{author["is_subscribed"]:d}'
+        )
+    return ''.join(flags)
+
+
+class CachedRecipeMixin:
+    """Serve recipe list and detail pages from a shared cache.
+
+    The cached payload is the anonymous one, with every user flag unset;
+    authenticated requests get their favorites, cart and follows laid
+    over it from the relation cache. List keys carry the versions of
+    ``RECIPE_NAMESPACES``; detail keys carry ``Recipe.updated_at`` and
+    the versions of ``RECIPE_DETAIL_NAMESPACES`` only, so editing one
+    recipe leaves the other detail pages cached. Pages
+    in a ranked ``?ordering=`` also carry ``RANKING_NAMESPACES`` and keep
+    their order until the next ``recompute_trending`` run or timeout.
+    Filters by the user's own relations are not cached.
+    """
+
+    uncached_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def recipe_cache_key(self, request, updated_at=None):
+        if updated_at is not None:
+            key = (
+                f'recipe:{get_versions(RECIPE_DETAIL_NAMESPACES)}'
+                f':{updated_at.timestamp()}'
+            )
+        else:
+            namespaces = RECIPE_NAMESPACES
+            if 'ordering' in request.query_params:
+                namespaces += RANKING_NAMESPACES
+            key = f'recipes:{get_versions(namespaces)}'
+        return f'{key}:{request.build_absolute_uri()}'
+
+    def cached_recipes(self, request, build, key):
+        if request.accepted_renderer.format != 'json' or any(
+                param in request.query_params
+                for param in self.uncached_params):
+            return build()
+        entry = cache.get(key)
+        if entry is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            data = response.data
+            clear_user_flags(data)
+            content = FastJSONRenderer().render(data)
+            entry = (content, make_etag(content))
+            cache.set(key, entry, RECIPE_CACHE_TIMEOUT)
+        content, etag = entry
+        data = None
+        if request.user.is_authenticated:
+            data = json.loads(content)
+            flags = overlay_user_flags(data, request)
+            etag = make_etag(f'{etag}:{flags}'.encode())
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            if data is not None:
+                content = FastJSONRenderer().render(data)
+            response = HttpResponse(
+                content, content_type='application/json')
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_recipes(
+            request, lambda: super(CachedRecipeMixin, self).list(
+                request, *args, **kwargs),
+            self.recipe_cache_key(request))
+
+    def retrieve(self, request, *args, **kwargs):
+        def build():
+            return super(CachedRecipeMixin, self).retrieve(
+                request, *args, **kwargs)
+
+        pk = str(kwargs.get(self.lookup_field, ''))
+        updated_at = pk.isdigit() and Recipe.objects.filter(
+            pk=pk).values_list('updated_at', flat=True).first()
+        if not updated_at:
+            return build()
+        return self.cached_recipes(
+            request, build, self.recipe_cache_key(request, updated_at))
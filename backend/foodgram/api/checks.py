@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Backends that keep their data in the memory of one process.
+PROCESS_LOCAL_RELATION_BACKENDS = ('api.relations.LocMemBackend',)
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+def workers():
+    return int(getattr(settings, 'WEB_CONCURRENCY', 1) or 1)
+
+
+@register()
+def check_relation_cache(app_configs, **kwargs):
+    # Writes only invalidate the sets of the process that made them, so
+    # the other workers would answer from stale sets until TIMEOUT.
+    backend = getattr(settings, 'RELATION_CACHE', {}).get(
+        'BACKEND', 'api.relations.LocMemBackend')
+    if workers() > 1 and backend in PROCESS_LOCAL_RELATION_BACKENDS:
+        return [Error(
+            f'RELATION_CACHE использует {backend} при WEB_CONCURRENCY = '
+            f'{workers()}: остальные процессы будут отдавать устаревшие '
+            'is_favorited и is_subscribed.',
+            hint="Задайте REDIS_URL или 'api.relations.RedisBackend' "
+                 'в RELATION_CACHE.',
+            id='api.E001',
+        )]
+    return []
+
+
+@register()
+def check_response_cache(app_configs, **kwargs):
+    # Namespace versions live in the default cache: a bump in one worker
+    # leaves the others serving the old pages and ETags.
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if workers() > 1 and backend in PROCESS_LOCAL_CACHE_BACKENDS:
+        return [Error(
+            f'CACHES использует {backend} при WEB_CONCURRENCY = '
+            f'{workers()}: остальные процессы будут отдавать устаревшие '
+            'страницы и ETag.',
+            hint='Задайте общий кеш в CACHE_BACKEND, например '
+                 'django.core.cache.backends.db.DatabaseCache.',
+            id='api.E002',
+        )]
+    return []
@@ -0,0 +1,279 @@
+import csv
+import io
+import textwrap
+from itertools import chain
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework import renderers
+
+TITLE = 'Список покупок'
+
+
+class ShoppingListExporter(renderers.BaseRenderer):
+    """Renderer that streams an aggregated shopping list.
+
+    ``stream`` takes the rows of the ``IngredientNumber`` values queryset
+    and yields encoded chunks, so the response never holds the whole
+    document. The view answers errors in JSON; ``render`` is a plain
+    text fallback for other callers.
+    """
+
+    charset = None
+
+    def format_row(self, row):
+        return (
+            f'{row["ingredient__name"]} '
+            f'({row["ingredient__measurement_unit"]}) — {row["number__sum"]}'
+        )
+
+    def encode(self, lines):
+        raise NotImplementedError
+
+    def stream(self, rows):
+        return self.encode(self.format_row(row) for row in rows)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        detail = data.get('detail', data) if isinstance(data, dict) else data
+        return b''.join(self.encode([str(detail)]))
+
+
+class TextExporter(ShoppingListExporter):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def encode(self, lines):
+        yield f'{TITLE}\n\n'.encode()
+        for line in lines:
+            yield f'{line}\n'.encode()
+
+
+class CsvExporter(ShoppingListExporter):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    header = ('Ингредиент', 'Единица измерения', 'Количество')
+
+    def format_row(self, row):
+        return (
+            row['ingredient__name'],
+            row['ingredient__measurement_unit'],
+            row['number__sum'],
+        )
+
+    def encode(self, lines):
+        buffer = io.StringIO()
+        output = csv.writer(buffer)
+        for values in chain((self.header,), lines):
+            output.writerow(
+                values if isinstance(values, tuple) else (values,))
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+
+# Advance widths of Arial, in thousandths of the font size, for the
+# Windows-1251 codes from FIRST_CHAR on; codes without a glyph are 0.
+# Taken from Liberation Sans, which shares the metrics of Arial.
+FIRST_CHAR = 32
+WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584,
+    278, 333, 278, 278, 556, 556, 556, 556, 556, 556, 556, 556,
+    556, 556, 278, 278, 584, 584, 584, 556, 1015, 667, 667, 722,
+    722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278,
+    278, 278, 469, 556, 333, 556, 556, 500, 556, 556, 278, 556,
+    556, 222, 222, 500, 222, 833, 556, 556, 556, 556, 333, 500,
+    278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584, 0,
+    865, 542, 222, 365, 333, 1000, 556, 556, 556, 1000, 1057, 333,
+    1010, 583, 854, 719, 556, 222, 222, 333, 333, 350, 556, 1000,
+    0, 1000, 906, 333, 812, 438, 556, 552, 278, 635, 500, 500,
+    556, 489, 260, 556, 667, 737, 719, 556, 584, 333, 737, 278,
+    400, 549, 278, 222, 411, 576, 537, 333, 556, 1073, 510, 556,
+    222, 667, 500, 278, 667, 656, 667, 542, 677, 667, 923, 604,
+    719, 719, 583, 656, 833, 722, 778, 719, 667, 722, 611, 635,
+    760, 667, 740, 667, 917, 938, 792, 885, 656, 719, 1010, 722,
+    556, 573, 531, 365, 583, 556, 669, 458, 559, 559, 438, 583,
+    688, 552, 556, 542, 556, 500, 458, 500, 823, 500, 573, 521,
+    802, 823, 625, 719, 521, 510, 750, 542,
+)
+
+
+def pdf_string(text):
+    raw = text.encode('cp1251', errors='replace')
+    return b'(' + raw.replace(b'\\', b'\\\\').replace(
+        b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def cp1251_glyphs():
+    for code in range(128, 256):
+        try:
+            yield code, ord(bytes((code,)).decode('cp1251'))
+        except UnicodeDecodeError:
+            continue
+
+
+def to_unicode_cmap():
+    chars = [(code, code) for code in range(32, 127)]
+    chars.extend(cp1251_glyphs())
+    blocks = []
+    for start in range(0, len(chars), 100):
+        block = chars[start:start + 100]
+        blocks.append(f'{len(block)} beginbfchar\n' + ''.join(
+            f'<{code:02X}> <{char:04X}>\n' for code, char in block
+        ) + 'endbfchar\n')
+    return (
+        '/CIDInit /ProcSet findresource begin\n'
+        '12 dict begin\nbegincmap\n'
+        '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+        '/Supplement 0 >> def\n'
+        '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+        '1 begincodespacerange\n<00> <FF>\nendcodespacerange\n'
+        + ''.join(blocks)
+        + 'endcmap\nCMapName currentdict /CMap defineresource pop\n'
+        'end\nend\n'
+    ).encode()
+
+
+class PdfWriter:
+    """Minimal single-font PDF writer that emits the file page by page.
+
+    Text is encoded as Windows-1251 and mapped to glyph names through the
+    font's /Differences array, which covers the Cyrillic ingredient names
+    without embedding a font program; /Widths carries the Arial metrics
+    that viewers need to place the glyphs.
+    """
+
+    page_width = 595
+    page_height = 842
+    margin = 50
+    font_size = 11
+    leading = 16
+    title_size = 16
+    wrap_width = 85
+    font_name = 'Arial'
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.pages = []
+        self.next_id = 6
+
+    @property
+    def lines_per_page(self):
+        return (self.page_height - 2 * self.margin) // self.leading
+
+    def obj(self, number, body, stream=None):
+        chunk = f'{number} 0 obj\n'.encode() + body
+        if stream is not None:
+            chunk += (
+                f'\n/Length {len(stream)} >>\nstream\n'.encode()
+                + stream + b'\nendstream'
+            )
+        chunk += b'\nendobj\n'
+        self.offsets[number] = self.position
+        self.position += len(chunk)
+        return chunk
+
+    def write(self, chunk):
+        self.position += len(chunk)
+        return chunk
+
+    def font_objects(self):
+        differences = ' '.join(
+            f'{code} /uni{char:04X}' for code, char in cp1251_glyphs())
+        widths = ' '.join(map(str, WIDTHS))
+        last_char = FIRST_CHAR + len(WIDTHS) - 1
+        yield self.obj(3, (
+            f'<< /Type /Font /Subtype /TrueType /BaseFont /{self.font_name} '
+            f'/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+            f'/Differences [{differences}] >> '
+            f'/FirstChar {FIRST_CHAR} /LastChar {last_char} '
+            f'/Widths [{widths}] '
+            f'/FontDescriptor 5 0 R /ToUnicode 4 0 R >>'
+        ).encode())
+        yield self.obj(4, b'<<', to_unicode_cmap())
+        yield self.obj(5, (
+            f'<< /Type /FontDescriptor /FontName /{self.font_name} '
+            f'/Flags 32 /FontBBox [-665 -325 2000 1006] /ItalicAngle 0 '
+            f'/Ascent 905 /Descent -212 /CapHeight 716 /StemV 80 >>'
+        ).encode())
+
+    def page(self, lines, title=None):
+        top = self.page_height - self.margin
+        content = [f'BT 1 0 0 1 {self.margin} {top} Tm'.encode()]
+        if title is not None:
+            content.append(
+                f'/F1 {self.title_size} Tf '.encode()
+                + pdf_string(title) + b' Tj'
+            )
+            content.append(f'0 -{2 * self.leading} Td'.encode())
+        content.append(
+            f'/F1 {self.font_size} Tf {self.leading} TL'.encode())
+        content.extend(pdf_string(line) + b" '" for line in lines)
+        content.append(b'ET')
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.pages.append(page_id)
+        yield self.obj(content_id, b'<<', b'\n'.join(content))
+        yield self.obj(page_id, (
+            f'<< /Type /Page /Parent 2 0 R '
+            f'/MediaBox [0 0 {self.page_width} {self.page_height}] '
+            f'/Resources << /Font << /F1 3 0 R >> >> '
+            f'/Contents {content_id} 0 R >>'
+        ).encode())
+
+    def wrapped(self, lines):
+        for line in lines:
+            yield from textwrap.wrap(line, self.wrap_width) or ['']
+
+    def document(self, lines, title=TITLE):
+        yield self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        yield from self.font_objects()
+        page = []
+        capacity = self.lines_per_page - 2
+        for line in self.wrapped(lines):
+            page.append(line)
+            if len(page) == capacity:
+                yield from self.page(page, title)
+                page, title, capacity = [], None, self.lines_per_page
+        if page or not self.pages:
+            yield from self.page(page, title)
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.pages)
+        yield self.obj(2, (
+            f'<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>'
+        ).encode())
+        yield self.obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        xref_position = self.position
+        size = self.next_id
+        xref = [f'xref\n0 {size}\n0000000000 65535 f \n']
+        xref.extend(
+            f'{self.offsets[number]:010d} 00000 n \n'
+            for number in range(1, size)
+        )
+        yield self.write((
+            ''.join(xref)
+            + f'trailer\n<< /Size {size} /Root 1 0 R >>\n'
+            f'startxref\n{xref_position}\n%%EOF\n'
+        ).encode())
+
+
+class PdfExporter(ShoppingListExporter):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+    def encode(self, lines):
+        return PdfWriter().document(lines)
+
+
+def get_exporters():
+    return tuple(
+        import_string(path) for path in getattr(
+            settings, 'SHOPPING_LIST_EXPORTERS', (
+                'api.exporters.PdfExporter',
+                'api.exporters.TextExporter',
+                'api.exporters.CsvExporter',
+            )
+        )
+    )
@@ -0,0 +1,93 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pdfkit
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.template.loader import get_template
+from django.utils import timezone
+from recipes.models import IngredientNumber, ShoppingListExport
+
+EXPORT_WORKERS = getattr(settings, 'SHOPPING_LIST_EXPORT_WORKERS', 2)
+EXPORT_TIMEOUT = timedelta(
+    seconds=getattr(settings, 'SHOPPING_LIST_EXPORT_TIMEOUT', 60))
+
+executor = ThreadPoolExecutor(
+    max_workers=EXPORT_WORKERS, thread_name_prefix='shopping-list')
+
+
+def shopping_list_queryset(user):
+    return (
+        IngredientNumber.objects.filter(recipe__shopping_cart__user=user)
+        .values('ingredient__name', 'ingredient__measurement_unit')
+        .annotate(Sum('number'))
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
+    )
+
+
+def get_shopping_list(user):
+    return list(shopping_list_queryset(user))
+
+
+def get_digest(rows):
+    return hashlib.sha256(
+        json.dumps(rows, ensure_ascii=False, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def render_pdf(rows):
+    html = get_template('shopping_cart.html').render({'page_objects': rows})
+    return pdfkit.from_string(html, False, options={'encoding': 'UTF-8'})
+
+
+def save_pdf(export, rows):
+    export.file.save(
+        f'{export.digest}.pdf', ContentFile(render_pdf(rows)), save=False)
+    export.status = ShoppingListExport.DONE
+    export.save()
+    # Only finished exports requested before this one: pending ones are
+    # still rendering and polled, newer ones belong to a newer cart.
+    for stale in ShoppingListExport.objects.filter(
+            user=export.user_id, pk__lt=export.pk,
+            status__in=(ShoppingListExport.DONE, ShoppingListExport.FAILED)):
+        stale.file.delete(save=False)
+        stale.delete()
+
+
+def run_export(export_id, rows):
+    close_old_connections()
+    try:
+        export = ShoppingListExport.objects.get(pk=export_id)
+        try:
+            save_pdf(export, rows)
+        except Exception:
+            export.status = ShoppingListExport.FAILED
+            export.save()
+            raise
+    finally:
+        close_old_connections()
+
+
+def request_export(user, rows):
+    """Return the export for the current cart, queueing it if needed.
+
+    Exports are keyed by a digest of the aggregated cart, so an unchanged
+    cart reuses the already rendered file.
+    """
+    export, created = ShoppingListExport.objects.get_or_create(
+        user=user, digest=get_digest(rows))
+    stalled = (
+        export.status == ShoppingListExport.PENDING
+        and timezone.now() - export.updated > EXPORT_TIMEOUT
+    )
+    if not created and export.status == ShoppingListExport.DONE:
+        return export
+    if created or stalled or export.status == ShoppingListExport.FAILED:
+        export.status = ShoppingListExport.PENDING
+        export.save()
+        executor.submit(run_export, export.pk, rows)
+    return export
@@ -0,0 +1,147 @@
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.db.models import QuerySet
+from recipes.models import IngredientNumber, Recipe
+from users.models import User
+
+from .relations import relation_cache
+from .renderers import Fragment, encode
+
+RECIPE_FIELDS = (
+    'id', 'author_id', 'name', 'image', 'image_thumbnails', 'text',
+    'cooking_time', 'is_favorited', 'is_in_shopping_cart',
+    # Positions of the cursor in the ranked orderings.
+    'popularity', 'trending_score',
+)
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+# Pre-encoded tags and ingredient prefixes, keyed by every value they
+# encode, so an edited tag or ingredient simply gets a new entry.
+FRAGMENTS_MAX_SIZE = 10000
+tag_fragments = {}
+ingredient_prefixes = {}
+
+
+def remember(fragments, key, value):
+    if len(fragments) >= FRAGMENTS_MAX_SIZE:
+        fragments.clear()
+    fragments[key] = value
+    return value
+
+
+def tag_fragment(row):
+    fragment = tag_fragments.get(row)
+    if fragment is not None:
+        return fragment
+    return remember(tag_fragments, row, Fragment({
+        'id': row[0], 'name': row[1], 'color': row[2], 'slug': row[3],
+    }))
+
+
+def ingredient_fragment(row, amount):
+    value = {
+        'id': row[0], 'name': row[1], 'measurement_unit': row[2],
+        'amount': amount,
+    }
+    prefix = ingredient_prefixes.get(row)
+    if prefix is None:
+        # Everything up to the amount, which is a plain integer.
+        encoded = encode(value)
+        prefix = remember(
+            ingredient_prefixes, row,
+            encoded[:encoded.rindex(b':') + 1])
+    return Fragment(value, prefix + b'%d}' % amount)
+
+
+class FastRecipeListSerializer:
+    """Read-only twin of ``RecipeListSerializer`` for ``values()`` rows.
+
+    ``rows()`` turns a ``with_user_flags`` queryset into flat rows; ``data``
+    adds authors, tags and ingredients from three bulk ``values()``
+    queries and builds the same JSON shape as the DRF serializer, with no
+    field objects involved. Tags and ingredients are ``Fragment`` objects
+    that ``FastJSONRenderer`` splices in pre-encoded; authors stay dicts,
+    as the recipe cache lays ``is_subscribed`` over them.
+    """
+
+    def __init__(self, instance, context):
+        self.instance = instance
+        self.context = context
+
+    @staticmethod
+    def rows(queryset):
+        return queryset.prefetch_related(None).values(*RECIPE_FIELDS)
+
+    def image_url(self, row):
+        name = row['image']
+        if not name:
+            return None
+        size = self.context.get('image_size', 'detail')
+        thumbnails = row['image_thumbnails'] or {}
+        if thumbnails.get('source') == name and size in thumbnails:
+            name = thumbnails[size]
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def authors(self, author_ids):
+        request = self.context.get('request')
+        following = (
+            relation_cache.members(request, 'following')
+            if request is not None else frozenset()
+        )
+        authors = {}
+        for author in User.objects.filter(id__in=author_ids).values(
+                *AUTHOR_FIELDS):
+            author['is_subscribed'] = author['id'] in following
+            authors[author['id']] = author
+        return authors
+
+    def tags(self, recipe_ids):
+        tags = defaultdict(list)
+        for row in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('-tag__name').values_list(
+                'recipe_id', 'tag__id', 'tag__name', 'tag__color',
+                'tag__slug'):
+            tags[row[0]].append(tag_fragment(row[1:]))
+        return tags
+
+    def ingredients(self, recipe_ids):
+        ingredients = defaultdict(list)
+        for row in IngredientNumber.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).order_by('id').values_list(
+                'recipe_id', 'ingredient_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'number'):
+            ingredients[row[0]].append(
+                ingredient_fragment(row[1:4], row[4]))
+        return ingredients
+
+    @property
+    def data(self):
+        rows = self.instance
+        if isinstance(rows, QuerySet):
+            rows = self.rows(rows)
+        rows = list(rows)
+        recipe_ids = [row['id'] for row in rows]
+        authors = self.authors({row['author_id'] for row in rows})
+        tags = self.tags(recipe_ids)
+        ingredients = self.ingredients(recipe_ids)
+        return [
+            {
+                'id': row['id'],
+                'author': dict(authors[row['author_id']]),
+                'tags': tags[row['id']],
+                'ingredients': ingredients[row['id']],
+                'is_favorited': bool(row['is_favorited']),
+                'is_in_shopping_cart': bool(row['is_in_shopping_cart']),
+                'name': row['name'],
+                'image': self.image_url(row),
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+            }
+            for row in rows
+        ]
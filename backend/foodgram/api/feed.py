@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from recipes.models import Follow, Recipe, TimelineEntry
+
+FANOUT_LIMIT = getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+BACKFILL = getattr(settings, 'FEED_BACKFILL', 100)
+BATCH_SIZE = 1000
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'FEED_WORKERS', 2),
+    thread_name_prefix='feed',
+)
+
+
+def fan_out(recipe_id):
+    """Copy a new recipe into the timelines of its author's followers.
+
+    Recipes of authors with more than ``FEED_FANOUT_LIMIT`` followers are
+    left out of the timelines and merged into the feed on read instead.
+    """
+    close_old_connections()
+    try:
+        recipe = Recipe.objects.select_related('author').filter(
+            pk=recipe_id).first()
+        if recipe is None or recipe.author.followers_count > FANOUT_LIMIT:
+            return
+        # The flag is committed before the followers are read: a follow
+        # that commits later backfills this recipe on its own.
+        Recipe.objects.filter(pk=recipe_id).update(in_timelines=True)
+        followers = Follow.objects.filter(
+            author_id=recipe.author_id).values_list('user_id', flat=True)
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+                for user_id in followers.iterator()
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    finally:
+        close_old_connections()
+
+
+def schedule_fan_out(recipe):
+    transaction.on_commit(lambda: executor.submit(fan_out, recipe.pk))
+
+
+def backfill(user_id, author_id):
+    """Copy the author's fanned out recipes into a new follower's timeline.
+
+    The latest ``FEED_BACKFILL`` are copied right after the follow
+    commits; the older ones follow in the background.
+    """
+    transaction.on_commit(lambda: copy_recent(user_id, author_id))
+    transaction.on_commit(
+        lambda: executor.submit(copy_older, user_id, author_id))
+
+
+def fanned_out(author_id):
+    return Recipe.objects.filter(
+        author_id=author_id, in_timelines=True
+    ).order_by('-id').values_list('id', flat=True)
+
+
+def copy_to_timeline(user_id, recipe_ids):
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in recipe_ids
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def copy_recent(user_id, author_id):
+    copy_to_timeline(user_id, fanned_out(author_id)[:BACKFILL])
+
+
+def copy_older(user_id, author_id):
+    close_old_connections()
+    try:
+        copy_to_timeline(
+            user_id, fanned_out(author_id)[BACKFILL:].iterator())
+        # An unfollow committed meanwhile must not leave entries behind.
+        if not Follow.objects.filter(
+                user_id=user_id, author_id=author_id).exists():
+            unfollow(user_id, author_id)
+    finally:
+        close_old_connections()
+
+
+def unfollow(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+
+
+def feed_queryset(queryset, user):
+    """Recipes of the authors ``user`` follows, from ``queryset``.
+
+    Fanned out recipes come from the user's timeline; the rest, written
+    by high-fanout authors or before timelines existed, are merged from
+    the followed authors on read. Both are limited to the authors
+    followed now: a fan-out racing an unfollow can leave entries behind.
+    """
+    return queryset.filter(
+        Q(id__in=TimelineEntry.objects.filter(user=user).values('recipe_id'))
+        | Q(in_timelines=False),
+        author__in=Follow.objects.filter(user=user).values('author_id'),
+    ).order_by('-id')
@@ -1,16 +1,69 @@
-from django_filters import ModelMultipleChoiceFilter
+from django.db.models import Exists, OuterRef
+from django_filters import (CharFilter, ChoiceFilter,
+                            ModelMultipleChoiceFilter, NumberFilter)
 from django_filters.rest_framework import FilterSet
-from recipes.models import Recipe, Tag
+from recipes import fulltext
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
 
+# Values of ?ordering= and the index order each one reads recipes in.
+RECIPE_ORDERINGS = {
+    'popular': ('-popularity', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
 
-class TagRecipeFilter(FilterSet):
+FLAG_CHOICES = (('0', '0'), ('1', '1'))
+
+
+class RecipeFilter(FilterSet):
 
     tags = ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(),
         field_name='tags__slug',
-        to_field_name='slug'
+        to_field_name='slug',
+        method='filter_tags',
+    )
+    author = NumberFilter(field_name='author__id')
+    is_favorited = ChoiceFilter(
+        choices=FLAG_CHOICES, method='filter_is_favorited')
+    is_in_shopping_cart = ChoiceFilter(
+        choices=FLAG_CHOICES, method='filter_is_in_shopping_cart')
+    search = CharFilter(method='filter_search')
+    ordering = ChoiceFilter(
+        choices=[(value, value) for value in RECIPE_ORDERINGS],
+        method='filter_ordering',
     )
 
     class Meta:
         model = Recipe
-        fields = ('tags',)
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'ordering',
+        )
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__in=value)
+        ))
+
+    def filter_user_relation(self, queryset, model, value):
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value == '1' else queryset
+        condition = Exists(
+            model.objects.filter(user=user, recipe=OuterRef('pk')))
+        return queryset.filter(condition if value == '1' else ~condition)
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_user_relation(queryset, Favorite, value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_user_relation(queryset, ShoppingCart, value)
+
+    def filter_search(self, queryset, name, value):
+        return fulltext.search(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
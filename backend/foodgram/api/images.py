@@ -0,0 +1,192 @@
+import base64
+import binascii
+import io
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError, features
+from recipes.models import Recipe
+from rest_framework import serializers
+
+from .cache import bump_version
+
+MAX_SIZE = getattr(settings, 'RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+MAX_DIMENSION = getattr(settings, 'RECIPE_IMAGE_MAX_DIMENSION', 6000)
+THUMBNAIL_SIZES = getattr(settings, 'RECIPE_THUMBNAIL_SIZES', {
+    'card': (480, 480),
+    'detail': (1200, 1200),
+})
+UPLOAD_MAX_AGE = getattr(settings, 'RECIPE_IMAGE_UPLOAD_MAX_AGE', 24 * 60 * 60)
+UPLOAD_SALT = 'recipe-image-upload'
+# Base64 characters decoded per step; a multiple of four keeps the
+# chunks aligned to whole quanta.
+DECODE_CHUNK = 64 * 1024
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'RECIPE_IMAGE_WORKERS', 2),
+    thread_name_prefix='recipe-images',
+)
+
+
+def check_dimensions(file):
+    too_large = serializers.ValidationError(
+        f'Размер изображения не должен превышать '
+        f'{MAX_DIMENSION}×{MAX_DIMENSION} пикселей'
+    )
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        raise too_large
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        # Truncated or malformed headers fail with OSError or SyntaxError.
+        raise serializers.ValidationError('Файл не является изображением')
+    finally:
+        file.seek(0)
+    if max(width, height) > MAX_DIMENSION:
+        raise too_large
+
+
+def base64_chunks(encoded):
+    """Yield runs of whole base64 quanta, whitespace removed.
+
+    Line-wrapped (MIME style) base64 has newlines in it, which the strict
+    decoder rejects and which would shift the chunks off the quanta.
+    """
+    pending = ''
+    for start in range(0, len(encoded), DECODE_CHUNK):
+        pending += ''.join(encoded[start:start + DECODE_CHUNK].split())
+        aligned = len(pending) - len(pending) % 4
+        yield pending[:aligned]
+        pending = pending[aligned:]
+    if pending:
+        yield pending
+
+
+def write_decoded(file, encoded):
+    size = 0
+    for encoded_chunk in base64_chunks(encoded):
+        try:
+            chunk = base64.b64decode(encoded_chunk, validate=True)
+        except binascii.Error:
+            raise serializers.ValidationError('Некорректная строка base64')
+        size += len(chunk)
+        if size > MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Размер изображения не должен превышать '
+                f'{MAX_SIZE // (1024 * 1024)} МБ'
+            )
+        file.write(chunk)
+    return size
+
+
+def decode_base64_image(data):
+    """Decode a data URI into a temporary file, chunk by chunk.
+
+    The decoded image goes to disk rather than a second in-memory copy,
+    and decoding stops as soon as it exceeds ``RECIPE_IMAGE_MAX_SIZE``.
+    """
+    header, _, encoded = data.partition(';base64,')
+    ext = header.split('/')[-1]
+    file = TemporaryUploadedFile(
+        f'{uuid.uuid4()}.{ext}', f'image/{ext}', 0, None)
+    try:
+        file.size = write_decoded(file, encoded)
+        file.seek(0)
+        check_dimensions(file)
+    except serializers.ValidationError:
+        file.close()
+        raise
+    return file
+
+
+def check_upload(file):
+    if file.size > MAX_SIZE:
+        raise serializers.ValidationError(
+            f'Размер изображения не должен превышать '
+            f'{MAX_SIZE // (1024 * 1024)} МБ'
+        )
+    check_dimensions(file)
+
+
+def save_upload(file, user):
+    """Store an uploaded image under ``recipes/`` and return its token.
+
+    Django upload handlers have already streamed the body to a temporary
+    file in chunks, so the storage only moves it into ``MEDIA_ROOT``.
+    """
+    ext = os.path.splitext(file.name)[1].lower() or '.jpg'
+    path = default_storage.save(f'recipes/{uuid.uuid4()}{ext}', file)
+    return signing.dumps({'path': path, 'user': user.id}, salt=UPLOAD_SALT)
+
+
+def resolve_upload_token(token, user):
+    try:
+        upload = signing.loads(token, salt=UPLOAD_SALT, max_age=UPLOAD_MAX_AGE)
+    except signing.BadSignature:
+        raise serializers.ValidationError(
+            'Недействительный или просроченный токен загрузки')
+    if upload['user'] != user.id or not default_storage.exists(
+            upload['path']):
+        raise serializers.ValidationError(
+            'Недействительный или просроченный токен загрузки')
+    return upload['path']
+
+
+def thumbnail_format():
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def thumbnail_name(source, size):
+    root = os.path.splitext(os.path.basename(source))[0]
+    return f'recipes/thumbnails/{root}_{size}.{thumbnail_format()[1]}'
+
+
+def render_thumbnail(image, bounds):
+    image = image.copy()
+    image.thumbnail(bounds)
+    image_format = thumbnail_format()[0]
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, image_format, quality=80)
+    return output.getvalue()
+
+
+def make_thumbnails(recipe_id, source):
+    close_old_connections()
+    try:
+        with default_storage.open(source) as file, Image.open(file) as image:
+            image.load()
+            thumbnails = {'source': source}
+            for size, bounds in THUMBNAIL_SIZES.items():
+                name = thumbnail_name(source, size)
+                default_storage.delete(name)
+                thumbnails[size] = default_storage.save(
+                    name, ContentFile(render_thumbnail(image, bounds)))
+        previous = Recipe.objects.filter(pk=recipe_id).values_list(
+            'image_thumbnails', flat=True).first() or {}
+        if Recipe.objects.filter(pk=recipe_id, image=source).update(
+                image_thumbnails=thumbnails, updated_at=timezone.now()):
+            # The thumbnails of a replaced image are no longer referenced.
+            for size, name in previous.items():
+                if size != 'source' and name not in thumbnails.values():
+                    default_storage.delete(name)
+        bump_version('recipes')
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(recipe):
+    if recipe.image and (
+            recipe.image_thumbnails.get('source') != recipe.image.name):
+        transaction.on_commit(lambda: executor.submit(
+            make_thumbnails, recipe.pk, recipe.image.name))
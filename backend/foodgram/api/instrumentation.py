@@ -0,0 +1,356 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+OPTIONS = {
+    'ENABLED': False,
+    # Recent requests per view kept for the rolling percentiles.
+    'WINDOW': 1000,
+    # A query template repeated this many times in one request is an N+1.
+    'N_PLUS_ONE_THRESHOLD': 10,
+    # Directory for per-process snapshots read by perf_report and merged
+    # by the metrics endpoint; None keeps the numbers in this process.
+    'SNAPSHOT_DIR': None,
+    'FLUSH_INTERVAL': 10,
+    'METRICS_ALLOWED_IPS': ('127.0.0.1',),
+}
+OPTIONS.update(getattr(settings, 'INSTRUMENTATION', {}))
+
+SECONDS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+HISTOGRAMS = {
+    'request_duration_seconds': SECONDS_BUCKETS,
+    'db_duration_seconds': SECONDS_BUCKETS,
+    'serialization_duration_seconds': SECONDS_BUCKETS,
+    'db_queries': QUERY_BUCKETS,
+}
+PLACEHOLDERS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+NUMBERS = re.compile(r'\b\d+\b')
+
+current_probe = contextvars.ContextVar('instrumentation_probe', default=None)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def query_template(sql):
+    return NUMBERS.sub('N', PLACEHOLDERS.sub('(...)', sql))
+
+
+class Probe:
+    """Measurements of one request, fed by a database execute wrapper."""
+
+    def __init__(self):
+        self.view = 'unresolved'
+        self.render_started = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.serializing = False
+        self.templates = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.templates[query_template(sql)] += 1
+
+    def repeated(self, threshold):
+        return {
+            template: count for template, count in self.templates.items()
+            if count >= threshold
+        }
+
+
+class Histogram:
+    def __init__(self, buckets, counts=None, total=0.0):
+        self.buckets = buckets
+        self.counts = counts or [0] * (len(buckets) + 1)
+        self.total = total
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            running += count
+            yield bound, running
+
+
+class ViewStats:
+    def __init__(self, window=None):
+        self.histograms = {
+            name: Histogram(buckets) for name, buckets in HISTOGRAMS.items()
+        }
+        # (latency, queries, db time, serialization time) of recent requests
+        self.recent = deque(maxlen=window or OPTIONS['WINDOW'])
+        self.n_plus_one = Counter()
+
+    def record(self, probe, latency):
+        for name, value in (
+            ('request_duration_seconds', latency),
+            ('db_duration_seconds', probe.db_time),
+            ('serialization_duration_seconds', probe.serialization_time),
+            ('db_queries', probe.queries),
+        ):
+            self.histograms[name].observe(value)
+        self.recent.append(
+            (latency, probe.queries, probe.db_time, probe.serialization_time))
+
+    @property
+    def requests(self):
+        return sum(self.histograms['request_duration_seconds'].counts)
+
+    def merge(self, other):
+        for name, histogram in other.histograms.items():
+            self.histograms[name].merge(histogram)
+        self.recent.extend(other.recent)
+        self.n_plus_one.update(other.n_plus_one)
+
+    def to_dict(self):
+        return {
+            'histograms': {
+                name: {'counts': histogram.counts, 'total': histogram.total}
+                for name, histogram in self.histograms.items()
+            },
+            'recent': list(self.recent),
+            'n_plus_one': dict(self.n_plus_one),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for name, histogram in data['histograms'].items():
+            stats.histograms[name] = Histogram(
+                HISTOGRAMS[name], histogram['counts'], histogram['total'])
+        stats.recent.extend(tuple(sample) for sample in data['recent'])
+        stats.n_plus_one.update(data['n_plus_one'])
+        return stats
+
+
+class Registry:
+    """Per-view statistics of this process, optionally shared via files."""
+
+    def __init__(self, snapshot_dir=None, flush_interval=10):
+        self.snapshot_dir = snapshot_dir
+        self.flush_interval = flush_interval
+        self.views = {}
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def record(self, view, probe, latency):
+        repeated = probe.repeated(OPTIONS['N_PLUS_ONE_THRESHOLD'])
+        with self.lock:
+            stats = self.views.setdefault(view, ViewStats())
+            stats.record(probe, latency)
+            stats.n_plus_one.update(repeated.keys())
+        for template, count in repeated.items():
+            logger.warning(
+                'N+1 в %s: запрос повторён %d раз: %.200s',
+                view, count, template)
+        if (self.snapshot_dir is not None
+                and time.monotonic() - self.flushed_at > self.flush_interval):
+            self.flush()
+
+    def snapshot_path(self, pid=None):
+        return os.path.join(self.snapshot_dir, f'{pid or os.getpid()}.json')
+
+    def flush(self):
+        with self.lock:
+            data = {
+                view: stats.to_dict() for view, stats in self.views.items()}
+            self.flushed_at = time.monotonic()
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = self.snapshot_path()
+        with open(f'{path}.tmp', 'w', encoding='UTF-8') as snapshot:
+            json.dump(data, snapshot)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """Merge the statistics of every process that left a snapshot."""
+        merged = {}
+        sources = []
+        if self.snapshot_dir is not None and os.path.isdir(self.snapshot_dir):
+            own = self.snapshot_path()
+            for name in sorted(os.listdir(self.snapshot_dir)):
+                path = os.path.join(self.snapshot_dir, name)
+                if name.endswith('.json') and path != own:
+                    with open(path, encoding='UTF-8') as snapshot:
+                        sources.append({
+                            view: ViewStats.from_dict(data)
+                            for view, data in json.load(snapshot).items()
+                        })
+        with self.lock:
+            sources.append({
+                view: ViewStats.from_dict(stats.to_dict())
+                for view, stats in self.views.items()
+            })
+        window = OPTIONS['WINDOW'] * len(sources)
+        for source in sources:
+            for view, stats in source.items():
+                merged.setdefault(view, ViewStats(window)).merge(stats)
+        return merged
+
+
+registry = Registry(OPTIONS['SNAPSHOT_DIR'], OPTIONS['FLUSH_INTERVAL'])
+
+
+def prometheus_text(views, prefix='foodgram'):
+    lines = []
+    for name in HISTOGRAMS:
+        lines.append(f'# TYPE {prefix}_{name} histogram')
+        for view, stats in sorted(views.items()):
+            histogram = stats.histograms[name]
+            for bound, count in histogram.cumulative():
+                lines.append(
+                    f'{prefix}_{name}_bucket{{view="{view}",le="{bound}"}} '
+                    f'{count}'
+                )
+            lines.append(
+                f'{prefix}_{name}_sum{{view="{view}"}} {histogram.total}')
+            lines.append(
+                f'{prefix}_{name}_count{{view="{view}"}} {stats.requests}')
+    lines.append(f'# TYPE {prefix}_n_plus_one_total counter')
+    for view, stats in sorted(views.items()):
+        lines.append(
+            f'{prefix}_n_plus_one_total{{view="{view}"}} '
+            f'{sum(stats.n_plus_one.values())}'
+        )
+    return '\n'.join(lines) + '\n'
+
+
+def execute_wrappers(probe):
+    """Feed the queries of this thread's connections to ``probe``."""
+    stack = ExitStack()
+    if probe is not None:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(probe))
+    return stack
+
+
+def view_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class TimedData:
+    """Serializer mixin adding ``data`` to the probe's serialization time."""
+
+    @property
+    def data(self):
+        probe = current_probe.get()
+        if probe is None or probe.serializing:
+            return super().data
+        probe.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            probe.serialization_time += time.perf_counter() - started
+            probe.serializing = False
+
+
+timed_classes = {}
+
+
+def timed(serializer):
+    """Time ``serializer.data`` for the probed request, if any."""
+    if current_probe.get() is None:
+        return serializer
+    serializer_class = type(serializer)
+    if serializer_class not in timed_classes:
+        timed_classes[serializer_class] = type(
+            serializer_class.__name__, (TimedData, serializer_class), {})
+    serializer.__class__ = timed_classes[serializer_class]
+    return serializer
+
+
+class TimedSerializerMixin:
+    """View mixin timing the serializers of ``get_serializer``.
+
+    Only serializers of probed requests are timed, through a subclass
+    made for the instance; the serializer classes stay untouched.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        return timed(super().get_serializer(*args, **kwargs))
+
+
+class InstrumentationMiddleware:
+    """Record per-view latency, queries, DB and serialization time.
+
+    Enabled with ``INSTRUMENTATION = {'ENABLED': True}``. Serialization
+    time covers the ``data`` of serializers from views with
+    ``TimedSerializerMixin`` and the rendering of the response, including
+    the queries they trigger. Streaming responses are recorded once
+    their body has been sent.
+    """
+
+    def __init__(self, get_response):
+        if not OPTIONS['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        probe = Probe()
+        token = current_probe.set(probe)
+        started = time.perf_counter()
+        try:
+            with execute_wrappers(probe):
+                response = self.get_response(request)
+            if probe.render_started is not None:
+                probe.serialization_time += (
+                    time.perf_counter() - probe.render_started)
+        finally:
+            current_probe.reset(token)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, probe, started)
+        else:
+            registry.record(
+                probe.view, probe, time.perf_counter() - started)
+        return response
+
+    def stream(self, content, probe, started):
+        try:
+            with execute_wrappers(probe):
+                yield from content
+        finally:
+            registry.record(
+                probe.view, probe, time.perf_counter() - started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_probe.get().view = view_name(request, view_func)
+
+    def process_template_response(self, request, response):
+        current_probe.get().render_started = time.perf_counter()
+        return response
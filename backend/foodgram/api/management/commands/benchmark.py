@@ -0,0 +1,90 @@
+import json
+
+from api.benchmarks import SCENARIOS, compare, run
+from django.core.management import BaseCommand, CommandError
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет все эндпоинты API через тестовый клиент DRF и '
+        'записывает задержки, число запросов к базе и пик памяти в JSON. '
+        'Данные готовит seed_synthetic; каждый запрос откатывается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='Email пользователя, от имени которого идут '
+            'запросы (по умолчанию первый синтетический с подписками)')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument(
+            '--scenario', action='append',
+            choices=[scenario.name for scenario in SCENARIOS],
+            help='Запустить только эти сценарии')
+        parser.add_argument('--output', help='Куда сохранить результаты')
+        parser.add_argument('--baseline', help='Результаты для сравнения')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост задержки и памяти (0.2 = 20%%)')
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Завершиться с ошибкой при регрессии')
+
+    def get_user(self, email):
+        users = User.objects.all()
+        if email is not None:
+            users = users.filter(email=email)
+        else:
+            users = users.filter(
+                username__startswith='synthetic',
+                recipes_count__gt=0,
+                following__isnull=False,
+            ).order_by('id')
+        user = users.first()
+        if user is None:
+            raise CommandError(
+                'Пользователь не найден: запустите seed_synthetic или '
+                'укажите --user')
+        return user
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='UTF-8') as data:
+                baseline = json.load(data)
+        try:
+            results = run(
+                self.get_user(options['user']), options['iterations'],
+                options['scenario'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            f'{"scenario":<32} {"status":>6} {"median ms":>10} '
+            f'{"p95 ms":>9} {"queries":>8} {"peak KB":>9}'
+        )
+        for name, result in results['results'].items():
+            self.stdout.write(
+                f'{name:<32} {result["status"]:>6} '
+                f'{result["median_ms"]:>10.2f} {result["p95_ms"]:>9.2f} '
+                f'{result["queries"]:>8} {result["peak_memory_kb"]:>9.1f}'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+        if baseline is not None:
+            self.report(results, baseline, options)
+
+    def report(self, results, baseline, options):
+        regressions = []
+        for name, metric, previous, current, regressed in compare(
+                results, baseline, options['threshold']):
+            if regressed:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'Регрессия {name}: {metric} {previous} → {current}'))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+        elif options['fail_on_regression']:
+            raise CommandError(
+                f'Регрессии в {len(set(regressions))} сценариях')
@@ -0,0 +1,38 @@
+from api.benchmarks import SCENARIOS
+from api.plans import check
+from django.core.management import CommandError
+
+from .benchmark import Command as BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Прогоняет сценарии бенчмарка, строит EXPLAIN для каждого запроса '
+        'и завершается с ошибкой, если поиск по таблицам связей '
+        '(избранное, корзина, подписки, ингредиенты, теги, лента) '
+        'идёт полным сканированием вместо индекса.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='Email пользователя, от имени которого идут '
+            'запросы (по умолчанию первый синтетический с подписками)')
+        parser.add_argument(
+            '--scenario', action='append',
+            choices=[scenario.name for scenario in SCENARIOS],
+            help='Проверить только эти сценарии')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        offenders = 0
+        try:
+            for name, tables, sql in check(user, options['scenario']):
+                offenders += 1
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: полное сканирование {", ".join(tables)}'))
+                self.stdout.write(f'  {sql[:500]}')
+        except ValueError as error:
+            raise CommandError(error)
+        if offenders:
+            raise CommandError(f'Запросов без индекса: {offenders}')
+        self.stdout.write(self.style.SUCCESS('Все планы используют индексы'))
@@ -0,0 +1,80 @@
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+from api.instrumentation import percentile
+from api.views import RecipeViewSet
+from django.core.management import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Follow
+from rest_framework.test import APIRequestFactory, force_authenticate
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон /api/recipes/feed/ от имени подписчиков: '
+        'задержки по перцентилям и число запросов к базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument(
+            '--pages', type=int, default=1,
+            help='Сколько страниц листать курсором за один запрос')
+
+    def handle(self, *args, **options):
+        user_ids = list(
+            Follow.objects.values_list('user_id', flat=True).distinct())
+        if not user_ids:
+            raise CommandError('Нет пользователей с подписками')
+        self.users = User.objects.in_bulk(user_ids)
+        self.view = RecipeViewSet.as_view({'get': 'feed'})
+        self.factory = APIRequestFactory()
+        self.options = options
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(
+                self.run, range(options['requests'])))
+        elapsed = time.monotonic() - started
+
+        latencies = [latency for latency, _ in results]
+        queries = [count for _, count in results]
+        self.stdout.write(
+            f'запросов: {len(results)}, '
+            f'{len(results) / elapsed:.1f} в секунду\n'
+            f'задержка, мс: p50 {percentile(latencies, 0.5):.1f}, '
+            f'p95 {percentile(latencies, 0.95):.1f}, '
+            f'p99 {percentile(latencies, 0.99):.1f}, '
+            f'max {max(latencies):.1f}\n'
+            f'запросов к базе: в среднем {statistics.mean(queries):.1f}, '
+            f'максимум {max(queries)}'
+        )
+
+    def run(self, number):
+        user = self.users[random.choice(list(self.users))]
+        params = {'limit': self.options['limit'], 'pagination': 'cursor'}
+        try:
+            started = time.monotonic()
+            with CaptureQueriesContext(connection) as context:
+                for _ in range(self.options['pages']):
+                    request = self.factory.get('/api/recipes/feed/', params)
+                    force_authenticate(request, user)
+                    response = self.view(request)
+                    if response.status_code != 200:
+                        raise CommandError(
+                            f'Ответ {response.status_code}: {response.data}')
+                    cursor = response.data['next']
+                    if cursor is None:
+                        break
+                    params['cursor'] = parse_qs(
+                        urlparse(cursor).query)['cursor'][0]
+            return (time.monotonic() - started) * 1000, len(context)
+        finally:
+            close_old_connections()
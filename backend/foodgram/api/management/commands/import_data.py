@@ -1,21 +1,234 @@
+import io
+import json
 import os
-from csv import reader
+import time
+from csv import reader, writer
+from itertools import islice
 
+from api.cache import bump_version
 from django.conf import settings
-from django.core.management import BaseCommand
-from recipes.models import Ingredient
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes import fulltext
+from recipes.counters import recount
+from recipes.models import Ingredient, IngredientNumber, Recipe, Tag
 
 DATA_PATH = os.path.join(settings.BASE_DIR, 'data')
 INGREDIENTS_DATA = os.path.join(DATA_PATH, 'ingredients.csv')
 
+FIELDS = {
+    'ingredients': ('name', 'measurement_unit'),
+    'tags': ('id', 'name', 'color', 'slug'),
+    'recipes': ('id', 'author', 'name', 'image', 'text', 'cooking_time'),
+}
+MODELS = {
+    'ingredients': Ingredient,
+    'tags': Tag,
+    'recipes': Recipe,
+}
+# Cache versions an import makes stale: bulk_create sends no signals.
+# Recipes also change the counters of their authors and the rankings.
+NAMESPACES = {
+    'ingredients': ('ingredients',),
+    'tags': ('tags',),
+    'recipes': ('recipes', 'users', 'rankings'),
+}
+
+
+def read_csv(path, fields):
+    with open(path, 'r', encoding='UTF-8') as data:
+        for row in reader(data):
+            if len(row) == len(fields):
+                yield dict(zip(fields, row))
+
+
+def read_json(path, fields):
+    with open(path, 'r', encoding='UTF-8') as data:
+        if path.endswith('.jsonl'):
+            for line in data:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(data)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты, теги или рецепты из CSV, JSON или JSON '
+        'Lines. Повторный запуск не создаёт дубликатов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=tuple(MODELS), default='ingredients')
+        parser.add_argument('--path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загрузка через COPY (только PostgreSQL, кроме рецептов)')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Прочитать и проверить файл без записи в базу')
+
+    def check_options(self, options):
+        model_name = options['model']
+        if options['path'] is None:
+            if model_name != 'ingredients':
+                raise CommandError('Укажите файл с данными в --path')
+            options['path'] = INGREDIENTS_DATA
+        if not os.path.exists(options['path']):
+            raise CommandError(f'Файл {options["path"]} не найден')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        if options['copy'] and (
+                connection.vendor != 'postgresql'
+                or model_name == 'recipes'):
+            raise CommandError(
+                'COPY доступен только для ингредиентов и тегов на PostgreSQL')
+        if model_name == 'recipes' and not options['path'].endswith(
+                ('.json', '.jsonl')):
+            raise CommandError('Рецепты загружаются только из JSON')
 
-    def handle(self, *args, **kwargs):
-        with open(INGREDIENTS_DATA, 'r', encoding='UTF-8') as ingredients:
-            for row in reader(ingredients):
-                if len(row) == 2:
-                    Ingredient.objects.get_or_create(
-                        name=row[0],
-                        measurement_unit=row[1],
+    def handle(self, *args, **options):
+        self.check_options(options)
+        model_name = options['model']
+        path = options['path']
+        fields = FIELDS[model_name]
+        read = read_json if path.endswith(('.json', '.jsonl')) else read_csv
+        model = MODELS[model_name]
+
+        started = time.monotonic()
+        before = model.objects.count()
+        processed = 0
+        with transaction.atomic():
+            for batch in batches(read(path, fields), options['batch_size']):
+                if options['dry_run']:
+                    self.validate(model, fields, batch)
+                elif options['copy']:
+                    self.copy(model, fields, batch)
+                elif model_name == 'recipes':
+                    self.load_recipes(batch)
+                else:
+                    model.objects.bulk_create(
+                        (model(**self.pick(fields, row)) for row in batch),
+                        ignore_conflicts=True,
                     )
+                processed += len(batch)
+                self.stdout.write(f'{model_name}: обработано {processed}')
+            if not options['dry_run']:
+                if model_name == 'recipes':
+                    recount()
+                transaction.on_commit(
+                    lambda: self.invalidate(NAMESPACES[model_name]))
+        created = model.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'{model_name}: {processed} строк, добавлено {created}, '
+            f'{time.monotonic() - started:.2f} с'
+            + (' (dry run)' if options['dry_run'] else '')
+        ))
+
+    @staticmethod
+    def invalidate(namespaces):
+        for namespace in namespaces:
+            bump_version(namespace)
+
+    @staticmethod
+    def pick(fields, row):
+        return {field: row[field] for field in fields if field in row}
+
+    def validate(self, model, fields, batch):
+        for row in batch:
+            missing = set(fields) - set(row) - {'image'}
+            if missing:
+                raise CommandError(
+                    f'{model.__name__}: нет полей {sorted(missing)} в {row}')
+
+    def copy(self, model, fields, batch):
+        table = model._meta.db_table
+        columns = ', '.join(
+            connection.ops.quote_name(model._meta.get_field(field).column)
+            for field in fields
+        )
+        buffer = io.StringIO()
+        writer(buffer).writerows(
+            [row[field] for field in fields] for row in batch)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE import_buffer ON COMMIT DROP AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.cursor.copy_expert(
+                f'COPY import_buffer ({columns}) FROM STDIN WITH CSV', buffer)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM import_buffer '
+                f'ON CONFLICT DO NOTHING'
+            )
+            cursor.execute('DROP TABLE import_buffer')
+
+    def skip_existing(self, batch):
+        """Drop rows whose id is taken and report the unrelated clashes.
+
+        A row matching the author and name of the recipe with its id was
+        imported before. Any other clash is a different recipe: its tags
+        and ingredients must not be attached to the one in the database.
+        """
+        existing = {
+            pk: (author_id, name)
+            for pk, author_id, name in Recipe.objects.filter(
+                pk__in=[row['id'] for row in batch],
+            ).values_list('pk', 'author_id', 'name')
+        }
+        clashes = [
+            row['id'] for row in batch
+            if row['id'] in existing
+            and existing[row['id']] != (row['author'], row['name'])
+        ]
+        if clashes:
+            self.stderr.write(
+                f'recipes: id заняты другими рецептами, пропущены: {clashes}')
+        return [row for row in batch if row['id'] not in existing]
+
+    def load_recipes(self, batch):
+        batch = self.skip_existing(batch)
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=row['author'],
+                    **self.pick(FIELDS['recipes'][2:] + ('id',), row)
+                )
+                for row in batch
+            ),
+            ignore_conflicts=True,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=row['id'], tag_id=tag)
+                for row in batch
+                for tag in row.get('tags', ())
+            ),
+            ignore_conflicts=True,
+        )
+        IngredientNumber.objects.bulk_create(
+            (
+                IngredientNumber(
+                    recipe_id=row['id'],
+                    ingredient_id=ingredient['id'],
+                    number=ingredient['amount'],
+                )
+                for row in batch
+                for ingredient in row.get('ingredients', ())
+            ),
+            ignore_conflicts=True,
+        )
+        fulltext.refresh(row['id'] for row in batch)
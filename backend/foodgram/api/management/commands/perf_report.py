@@ -0,0 +1,63 @@
+import statistics
+
+from api.instrumentation import OPTIONS, percentile, registry
+from django.core.management import BaseCommand, CommandError
+
+COLUMNS = {
+    'latency': 0,
+    'queries': 1,
+    'db': 2,
+    'serialization': 3,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводка по эндпоинтам из снимков InstrumentationMiddleware: '
+        'задержки, запросы к базе, время сериализации и N+1'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sort', choices=tuple(COLUMNS), default='latency',
+            help='Сортировка по p95 выбранной величины')
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if OPTIONS['SNAPSHOT_DIR'] is None:
+            raise CommandError(
+                'Укажите INSTRUMENTATION["SNAPSHOT_DIR"], куда процессы '
+                'сервера сохраняют статистику')
+        views = {
+            view: stats for view, stats in registry.collect().items()
+            if stats.recent
+        }
+        if not views:
+            self.stdout.write('Статистики пока нет')
+            return
+        column = COLUMNS[options['sort']]
+        ordered = sorted(
+            views.items(),
+            key=lambda item: percentile(
+                [sample[column] for sample in item[1].recent], 0.95),
+            reverse=True,
+        )[:options['limit']]
+        self.stdout.write(
+            f'{"view":<45} {"req":>7} {"p50 ms":>8} {"p95 ms":>8} '
+            f'{"queries":>8} {"db ms":>8} {"ser ms":>8} {"N+1":>5}'
+        )
+        for view, stats in ordered:
+            latency, queries, db_time, serialization = zip(*stats.recent)
+            self.stdout.write(
+                f'{view:<45} {stats.requests:>7} '
+                f'{percentile(latency, 0.5) * 1000:>8.1f} '
+                f'{percentile(latency, 0.95) * 1000:>8.1f} '
+                f'{statistics.mean(queries):>8.1f} '
+                f'{statistics.mean(db_time) * 1000:>8.1f} '
+                f'{statistics.mean(serialization) * 1000:>8.1f} '
+                f'{sum(stats.n_plus_one.values()):>5}'
+            )
+        for view, stats in ordered:
+            for template, requests in stats.n_plus_one.most_common(3):
+                self.stdout.write(self.style.WARNING(
+                    f'N+1 {view} ({requests} запросов): {template[:200]}'))
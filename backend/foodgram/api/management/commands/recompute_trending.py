@@ -0,0 +1,21 @@
+from api.cache import bump_version
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipes.trending import recompute
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинг популярных сейчас рецептов (?ordering='
+        'trending) по избранному и покупкам за последние окна времени. '
+        'Запускается периодически, например раз в 15 минут.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = recompute(batch_size=options['batch_size'])
+            transaction.on_commit(lambda: bump_version('rankings'))
+        self.stdout.write(f'Recipe.trending_score: обновлено {changed}')
@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipes.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, покупок, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = recount(batch_size=options['batch_size'])
+        for counter, changed in drift.items():
+            self.stdout.write(f'{counter}: исправлено {changed}')
@@ -0,0 +1,186 @@
+import base64
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from recipes import fulltext
+from recipes.counters import recount
+from recipes.models import (Favorite, Follow, Ingredient, IngredientNumber,
+                            Recipe, ShoppingCart, Tag)
+from users.models import User
+
+USERNAME_PREFIX = 'synthetic'
+PASSWORD = 'synthetic-password'
+IMAGE_PATH = 'recipes/synthetic.png'
+# 1×1 transparent PNG shared by every generated recipe.
+IMAGE = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA'
+    '60e6kgAAAABJRU5ErkJggg=='
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'рагу', 'каша', 'омлет', 'паста', 'плов',
+    'запеканка', 'котлеты', 'блины', 'соус', 'крем', 'десерт', 'гарнир',
+    'острый', 'сладкий', 'домашний', 'быстрый', 'летний', 'осенний',
+    'овощной', 'куриный', 'рыбный', 'сырный', 'грибной', 'ягодный',
+)
+TAG_COLORS = ('#0505ff', '#ddff03', '#738678', '#ff0000')
+
+
+def next_id(model):
+    return (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+
+def chunked(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетических пользователей, рецепты, подписки, '
+        'избранное и корзины для нагрузочных прогонов и бенчмарков. '
+        f'Пароль всех пользователей: {PASSWORD}'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredients', type=int, default=200,
+            help='Сколько ингредиентов должно быть в базе как минимум')
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['recipes'] < 0:
+            raise CommandError('Нужен хотя бы один пользователь')
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+        with transaction.atomic():
+            tag_ids = self.seed_tags()
+            ingredient_ids = self.seed_ingredients(options['ingredients'])
+            user_ids = self.seed_users(options['users'])
+            recipe_ids = self.seed_recipes(
+                options['recipes'], user_ids, tag_ids, ingredient_ids,
+                options['ingredients_per_recipe'])
+            self.seed_relations(
+                Follow, 'author_id', user_ids, user_ids,
+                options['follows_per_user'], exclude_self=True)
+            self.seed_relations(
+                Favorite, 'recipe_id', user_ids, recipe_ids,
+                options['favorites_per_user'])
+            self.seed_relations(
+                ShoppingCart, 'recipe_id', user_ids, recipe_ids,
+                options['carts_per_user'])
+            recount()
+            fulltext.refresh(recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'))
+
+    def bulk_create(self, model, objects):
+        for batch in chunked(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+        self.stdout.write(f'{model.__name__}: {len(objects)}')
+
+    def seed_tags(self):
+        existing = list(Tag.objects.values_list('id', flat=True))
+        missing = len(TAG_COLORS) - len(existing)
+        if missing > 0:
+            start = next_id(Tag)
+            used = set(Tag.objects.values_list('color', flat=True))
+            colors = [color for color in TAG_COLORS if color not in used]
+            self.bulk_create(Tag, [
+                Tag(id=tag_id, name=f'{USERNAME_PREFIX}-{tag_id}',
+                    slug=f'{USERNAME_PREFIX}-{tag_id}', color=color)
+                for tag_id, color in enumerate(colors[:missing], start)
+            ])
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def seed_ingredients(self, count):
+        missing = count - Ingredient.objects.count()
+        if missing > 0:
+            start = next_id(Ingredient)
+            self.bulk_create(Ingredient, [
+                Ingredient(
+                    name=f'{self.random.choice(WORDS)} {start + number}',
+                    measurement_unit=self.random.choice(('г', 'мл', 'шт')),
+                )
+                for number in range(missing)
+            ])
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def seed_users(self, count):
+        start = next_id(User)
+        password = make_password(PASSWORD)
+        self.bulk_create(User, [
+            User(
+                id=start + number,
+                username=f'{USERNAME_PREFIX}{start + number}',
+                email=f'{USERNAME_PREFIX}{start + number}@example.com',
+                first_name='Synthetic',
+                last_name=str(start + number),
+                password=password,
+            )
+            for number in range(count)
+        ])
+        return list(range(start, start + count))
+
+    def seed_recipes(self, count, user_ids, tag_ids, ingredient_ids,
+                     per_recipe):
+        if not default_storage.exists(IMAGE_PATH):
+            default_storage.save(IMAGE_PATH, ContentFile(IMAGE))
+        start = next_id(Recipe)
+        recipe_ids = list(range(start, start + count))
+        choice, sample = self.random.choice, self.random.sample
+        self.bulk_create(Recipe, [
+            Recipe(
+                id=recipe_id,
+                author_id=choice(user_ids),
+                name=' '.join(sample(WORDS, 3)).capitalize(),
+                text=' '.join(choice(WORDS) for _ in range(40)),
+                image=IMAGE_PATH,
+                cooking_time=self.random.randint(5, 180),
+            )
+            for recipe_id in recipe_ids
+        ])
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in sample(tag_ids, min(2, len(tag_ids)))
+        ])
+        per_recipe = min(per_recipe, len(ingredient_ids))
+        self.bulk_create(IngredientNumber, [
+            IngredientNumber(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                number=self.random.randint(1, 999),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in sample(ingredient_ids, per_recipe)
+        ])
+        return recipe_ids
+
+    def seed_relations(self, model, field, user_ids, target_ids, per_user,
+                       exclude_self=False):
+        objects = []
+        for user_id in user_ids:
+            targets = [
+                target_id for target_id in self.random.sample(
+                    target_ids, min(per_user + 1, len(target_ids)))
+                if not (exclude_self and target_id == user_id)
+            ]
+            objects.extend(
+                model(user_id=user_id, **{field: target_id})
+                for target_id in targets[:per_user]
+            )
+        self.bulk_create(model, objects)
@@ -0,0 +1,91 @@
+import time
+
+from api import renderers
+from api.fast_serializers import FastRecipeListSerializer
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeListSerializer
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import BaseCommand
+from recipes.models import Recipe
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет скорость RecipeListSerializer и FastRecipeListSerializer, '
+        'JSONRenderer и FastJSONRenderer в рецептах в секунду. Совпадение '
+        'их вывода проверяют тесты api.tests.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=10)
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(
+            favorite__isnull=False).order_by('id').first()
+        self.benchmark(user or AnonymousUser(), options)
+
+    def benchmark(self, user, options):
+        request = self.make_request(user)
+        queryset = self.queryset(user, 0, options['page_size'])
+        for name, serialize in (
+            ('RecipeListSerializer', self.serialize),
+            ('FastRecipeListSerializer', self.fast_serialize),
+        ):
+            self.measure(name, options['iterations'], lambda: len(
+                serialize(queryset, request, 'card')))
+        data = self.serialize(queryset, request, 'card')
+        fast_data = self.fast_serialize(queryset, request, 'card')
+        default_dumps = renderers.dumps
+        try:
+            for name, dumps, render in (
+                ('JSONRenderer', None, JSONRenderer().render),
+                ('FastJSONRenderer, json', renderers.dumps_json,
+                 FastJSONRenderer().render),
+                ('FastJSONRenderer, orjson', renderers.dumps_orjson,
+                 FastJSONRenderer().render),
+            ):
+                if dumps is renderers.dumps_orjson and not renderers.orjson:
+                    continue
+                renderers.dumps = dumps or default_dumps
+                self.measure(name, options['iterations'], lambda: render(
+                    data) and len(data))
+                if dumps is not None:
+                    self.measure(
+                        f'{name} + фрагменты', options['iterations'],
+                        lambda: render(fast_data) and len(fast_data))
+        finally:
+            renderers.dumps = default_dumps
+
+    def measure(self, name, iterations, run):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            rows = run()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{name:<36} {rows * iterations / elapsed:>10.0f} рецептов/с')
+
+    def make_request(self, user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        return request
+
+    def queryset(self, user, offset, size):
+        return Recipe.objects.with_user_flags(user).order_by('-id')[
+            offset:offset + size]
+
+    def serialize(self, queryset, request, image_size):
+        return RecipeListSerializer(
+            queryset.all(), many=True,
+            context={'request': request, 'image_size': image_size},
+        ).data
+
+    def fast_serialize(self, queryset, request, image_size):
+        return FastRecipeListSerializer(
+            FastRecipeListSerializer.rows(queryset.all()),
+            context={'request': request, 'image_size': image_size},
+        ).data
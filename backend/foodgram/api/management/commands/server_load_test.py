@@ -0,0 +1,242 @@
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from urllib.parse import quote
+
+from api.instrumentation import percentile
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+PATHS = (
+    '/api/recipes/?limit=6',
+    '/api/recipes/download_shopping_cart/',
+    '/api/ingredients/?name=сол',
+)
+HOST = 'localhost'
+
+
+def wsgi_environ(path, token):
+    path, _, query = path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': HOST,
+        'HTTP_AUTHORIZATION': f'Token {token}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def asgi_scope(path, token):
+    path, _, query = path.partition('?')
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [
+            (b'host', HOST.encode()),
+            (b'authorization', f'Token {token}'.encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': (HOST, 80),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает WSGI и ASGI (foodgram.asgi с async-представлениями) '
+        'под высокой параллельностью: запросы в секунду и задержки по '
+        'перцентилям. Каждый сервер запускается в отдельном процессе '
+        'через обработчики Django, без сети.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', action='append',
+            help=f'Адреса для запросов по кругу (по умолчанию {PATHS})')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument(
+            '--concurrency', type=int, default=64,
+            help='Одновременных клиентов, каждый шлёт запросы по очереди')
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Потоков WSGI-воркера, как gunicorn --threads')
+        parser.add_argument(
+            '--user', help='Email пользователя (по умолчанию первый '
+            'синтетический с корзиной)')
+        parser.add_argument(
+            '--server', choices=('wsgi', 'asgi'),
+            help='Прогнать только этот сервер в текущем процессе и '
+            'вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        if options['server'] is not None:
+            self.stdout.write(json.dumps(self.measure(options)))
+            return
+        results = {
+            server: self.spawn(server, options) for server in ('wsgi', 'asgi')
+        }
+        self.stdout.write(
+            f'{"server":<6} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+            f'{"p99 ms":>8} {"max ms":>8} {"errors":>6}'
+        )
+        for server, result in results.items():
+            self.stdout.write(
+                f'{server:<6} {result["rps"]:>8.1f} {result["p50"]:>8.1f} '
+                f'{result["p95"]:>8.1f} {result["p99"]:>8.1f} '
+                f'{result["max"]:>8.1f} {result["errors"]:>6}'
+            )
+
+    def spawn(self, server, options):
+        command = [
+            sys.executable, sys.argv[0], 'server_load_test',
+            '--server', server,
+            '--requests', str(options['requests']),
+            '--concurrency', str(options['concurrency']),
+            '--threads', str(options['threads']),
+        ]
+        for path in options['path'] or ():
+            command.extend(('--path', path))
+        if options['user']:
+            command.extend(('--user', options['user']))
+        environment = dict(
+            os.environ, ASYNC_VIEWS='1' if server == 'asgi' else '')
+        completed = subprocess.run(
+            command, env=environment, stdout=subprocess.PIPE, check=False)
+        if completed.returncode:
+            raise CommandError(f'Прогон {server} завершился с ошибкой')
+        return json.loads(completed.stdout.decode().splitlines()[-1])
+
+    def get_token(self, email):
+        users = User.objects.all()
+        if email is not None:
+            users = users.filter(email=email)
+        else:
+            users = users.filter(
+                username__startswith='synthetic',
+                shopping_cart__isnull=False,
+            ).order_by('id')
+        user = users.first()
+        if user is None:
+            raise CommandError(
+                'Пользователь не найден: запустите seed_synthetic или '
+                'укажите --user')
+        return Token.objects.get_or_create(user=user)[0].key
+
+    def measure(self, options):
+        if (options['server'] == 'asgi') != settings.ASYNC_VIEWS:
+            raise CommandError(
+                'ASYNC_VIEWS=1 нужен для asgi и недопустим для wsgi')
+        token = self.get_token(options['user'])
+        close_old_connections()
+        paths = options['path'] or PATHS
+        paths = [quote(path, safe='/?=&%,') for path in paths]
+        requests = [
+            paths[number % len(paths)]
+            for number in range(options['requests'])
+        ]
+        concurrency = min(options['concurrency'], len(requests))
+        clients = [
+            requests[number::concurrency] for number in range(concurrency)]
+        started = time.perf_counter()
+        if options['server'] == 'wsgi':
+            results = self.run_wsgi(clients, token, options)
+        else:
+            results = asyncio.run(self.run_asgi(clients, token, options))
+        elapsed = time.perf_counter() - started
+        latencies = [latency * 1000 for latency, _ in results]
+        return {
+            'rps': len(results) / elapsed,
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies),
+            'errors': sum(status >= 400 for _, status in results),
+        }
+
+    def run_wsgi(self, clients, token, options):
+        # Clients beyond the worker threads wait for a free one, like
+        # connections waiting in the listen backlog of gunicorn.
+        application = get_wsgi_application()
+        workers = threading.BoundedSemaphore(options['threads'])
+
+        def call(path):
+            statuses = []
+            body = application(
+                wsgi_environ(path, token),
+                lambda status, headers, *args: statuses.append(status))
+            try:
+                for _ in body:
+                    pass
+            finally:
+                body.close()
+            return int(statuses[0].split()[0])
+
+        def client(paths):
+            results = []
+            for path in paths:
+                started = time.perf_counter()
+                with workers:
+                    status = call(path)
+                results.append((time.perf_counter() - started, status))
+            close_old_connections()
+            return results
+
+        with ThreadPoolExecutor(len(clients)) as pool:
+            return list(chain.from_iterable(pool.map(client, clients)))
+
+    async def run_asgi(self, clients, token, options):
+        application = get_asgi_application()
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def call(path):
+            statuses = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            await application(asgi_scope(path, token), receive, send)
+            return statuses[0]
+
+        async def client(paths):
+            results = []
+            for path in paths:
+                started = time.perf_counter()
+                status = await call(path)
+                results.append((time.perf_counter() - started, status))
+            return results
+
+        results = await asyncio.gather(*(client(paths) for paths in clients))
+        return list(chain.from_iterable(results))
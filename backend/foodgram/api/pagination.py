@@ -0,0 +1,50 @@
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    ordering = '-id'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        # Views ordered by a query parameter, like ?ordering=popular on
+        # recipes, tell the cursor which order to follow.
+        get_cursor_ordering = getattr(view, 'get_cursor_ordering', None)
+        ordering = get_cursor_ordering and get_cursor_ordering()
+        return ordering or super().get_ordering(request, queryset, view)
+
+
+class OptionalCursorPagination(pagination.BasePagination):
+    default_pagination_class = pagination.PageNumberPagination
+    cursor_pagination_class = CursorPagination
+    mode_query_param = 'pagination'
+
+    def get_paginator(self, request):
+        cursor_class = self.cursor_pagination_class
+        if (request.query_params.get(self.mode_query_param) == 'cursor'
+                or cursor_class.cursor_query_param in request.query_params):
+            return cursor_class()
+        return self.default_pagination_class()
+
+    @property
+    def display_page_controls(self):
+        paginator = getattr(self, 'paginator', None)
+        return paginator is not None and paginator.display_page_controls
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.default_pagination_class().get_paginated_response_schema(
+            schema)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+
+class LimitOffsetOrCursorPagination(OptionalCursorPagination):
+    default_pagination_class = pagination.LimitOffsetPagination
@@ -0,0 +1,116 @@
+import json
+import re
+
+from django.db import connection, transaction
+from rest_framework.test import APIClient
+
+from .benchmarks import SCENARIOS, Context, run_once
+
+# Relation tables and the columns the API looks rows up by. A full scan of
+# one of them is a regression when the query filters on such a column.
+HOT_LOOKUPS = {
+    'recipes_recipe': ('author_id',),
+    'recipes_favorite': ('user_id', 'recipe_id'),
+    'recipes_shoppingcart': ('user_id', 'recipe_id'),
+    'recipes_follow': ('user_id', 'author_id'),
+    'recipes_ingredientnumber': ('recipe_id',),
+    'recipes_recipe_tags': ('recipe_id', 'tag_id'),
+    'recipes_tag': ('slug',),
+    'recipes_timelineentry': ('user_id',),
+}
+# Columns recipes are ranked by. Sorting the table for a top-N page
+# instead of walking an index in that order is a regression as well.
+HOT_ORDERINGS = {
+    'recipes_recipe': ('popularity', 'trending_score'),
+}
+# Yielded by the scans below for a sort of the whole result.
+SORT = 'ORDER BY'
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+ALIASES = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?')
+
+
+def sqlite_scans(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+    for detail in details:
+        match = SQLITE_SCAN.match(detail)
+        # "SCAN t USING INDEX" walks an index, not the table.
+        if match and ' USING ' not in detail:
+            yield match.group(2) or match.group(1)
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            yield SORT
+
+
+def postgresql_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from postgresql_nodes(child)
+
+
+def postgresql_scans(sql):
+    # Seq scans stay possible with enable_seqscan off, but only when no
+    # index can serve the query, which is what the check is looking for.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    for node in postgresql_nodes(plan[0]['Plan']):
+        if node['Node Type'] == 'Seq Scan':
+            yield node.get('Alias') or node['Relation Name']
+        elif node['Node Type'] in ('Sort', 'Incremental Sort'):
+            yield SORT
+
+
+def degraded_tables(sql):
+    """Return the hot tables ``sql`` filters or ranks without an index."""
+    if connection.vendor == 'postgresql':
+        scanned = set(postgresql_scans(sql))
+    elif connection.vendor == 'sqlite':
+        scanned = set(sqlite_scans(sql))
+    else:
+        return set()
+    aliases = dict((alias, table) for table, alias in ALIASES.findall(sql))
+    _, where, conditions = sql.partition(' WHERE ')
+    _, _, ordering = sql.rpartition(' ORDER BY ')
+    degraded = set()
+    if SORT in scanned:
+        for table, columns in HOT_ORDERINGS.items():
+            if any(f'"{column}"' in ordering for column in columns):
+                degraded.add(table)
+    for name in scanned:
+        table = aliases.get(name, name)
+        for column in HOT_LOOKUPS.get(table, ()):
+            if (f'"{name}"."{column}"' in conditions
+                    or f'{name}."{column}"' in conditions):
+                degraded.add(table)
+    return degraded
+
+
+def check(user, names=None):
+    """Yield ``(scenario, tables, sql)`` for every degraded query plan."""
+    client = APIClient(raise_request_exception=False)
+    with transaction.atomic():
+        context = Context(user)
+        for scenario in SCENARIOS:
+            if names and scenario.name not in names:
+                continue
+            if not scenario.available():
+                continue
+            # The first run fills the caches the second one reads from;
+            # both sets of queries are what the scenario can cost.
+            queries = dict.fromkeys(
+                query['sql']
+                for _ in range(2)
+                for query in run_once(client, scenario, context)[2]
+            )
+            for sql in queries:
+                if not sql.lstrip().upper().startswith(EXPLAINED):
+                    continue
+                tables = degraded_tables(sql)
+                if tables:
+                    yield scenario.name, sorted(tables), sql
+        transaction.set_rollback(True)
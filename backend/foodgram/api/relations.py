@@ -0,0 +1,155 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from recipes.models import Favorite, Follow, ShoppingCart
+
+# Every stored set contains this id, so an empty relation can be told
+# apart from a set that has not been loaded yet.
+LOADED = 0
+
+RELATIONS = {
+    'following': (Follow, 'author_id'),
+    'favorite': (Favorite, 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'recipe_id'),
+}
+
+
+class LocMemBackend:
+    def __init__(self, timeout=None, **options):
+        self.timeout = timeout
+        self.sets = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            expires, members = self.sets.get(key, (None, None))
+            if expires is not None and expires < time.monotonic():
+                del self.sets[key]
+                return None
+            return None if members is None else set(members)
+
+    def generation(self, key):
+        with self.lock:
+            return self.generations.get(key, 0)
+
+    def set(self, key, members, generation):
+        expires = (
+            None if self.timeout is None
+            else time.monotonic() + self.timeout
+        )
+        with self.lock:
+            if self.generations.get(key, 0) == generation:
+                self.sets[key] = (expires, set(members) | {LOADED})
+
+    def delete(self, key):
+        with self.lock:
+            self.sets.pop(key, None)
+            self.generations[key] = self.generations.get(key, 0) + 1
+
+
+class RedisBackend:
+    def __init__(self, location, timeout=None, **options):
+        try:
+            import redis
+        except ImportError as error:
+            raise ImproperlyConfigured(
+                'Для RedisBackend нужен пакет redis') from error
+        self.client = redis.Redis.from_url(location)
+        self.watch_error = redis.WatchError
+        self.timeout = timeout
+
+    @staticmethod
+    def generation_key(key):
+        return f'{key}:generation'
+
+    def get(self, key):
+        members = {int(member) for member in self.client.smembers(key)}
+        return members if LOADED in members else None
+
+    def generation(self, key):
+        return int(self.client.get(self.generation_key(key)) or 0)
+
+    def set(self, key, members, generation):
+        generation_key = self.generation_key(key)
+        with self.client.pipeline() as pipeline:
+            try:
+                pipeline.watch(generation_key)
+                if int(pipeline.get(generation_key) or 0) != generation:
+                    return
+                pipeline.multi()
+                pipeline.delete(key)
+                pipeline.sadd(key, LOADED, *members)
+                if self.timeout is not None:
+                    pipeline.expire(key, self.timeout)
+                pipeline.execute()
+            except self.watch_error:
+                pass
+
+    def delete(self, key):
+        pipeline = self.client.pipeline()
+        pipeline.delete(key)
+        pipeline.incr(self.generation_key(key))
+        pipeline.execute()
+
+
+class RelationCache:
+    """Sets of followed authors, favorited and carted recipes per user.
+
+    Sets are read once per request and kept in the configured backend
+    between requests. A committed write deletes the user's set and bumps
+    its generation; a load that started before that write finds the
+    generation changed and leaves the backend alone, so it cannot store
+    the set as it was before the write.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def key(user_id, relation):
+        return f'relations:{relation}:{user_id}'
+
+    def load(self, user_id, relation):
+        key = self.key(user_id, relation)
+        generation = self.backend.generation(key)
+        model, field = RELATIONS[relation]
+        members = set(
+            model.objects.filter(user_id=user_id)
+            .values_list(field, flat=True)
+        )
+        self.backend.set(key, members, generation)
+        return members
+
+    def members(self, request, relation):
+        user = request.user
+        if not user.is_authenticated:
+            return frozenset()
+        loaded = request.__dict__.setdefault('_relations', {})
+        if relation not in loaded:
+            members = self.backend.get(self.key(user.id, relation))
+            if members is None:
+                members = self.load(user.id, relation)
+            loaded[relation] = frozenset(members)
+        return loaded[relation]
+
+    def contains(self, request, relation, pk):
+        return pk in self.members(request, relation)
+
+    def invalidate(self, user_id, relation):
+        self.backend.delete(self.key(user_id, relation))
+
+
+def get_relation_cache():
+    options = dict(getattr(settings, 'RELATION_CACHE', {}))
+    backend = import_string(
+        options.pop('BACKEND', 'api.relations.LocMemBackend'))
+    return RelationCache(backend(**{
+        name.lower(): value for name, value in options.items()
+    }))
+
+
+relation_cache = get_relation_cache()
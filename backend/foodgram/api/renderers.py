@@ -0,0 +1,163 @@
+import io
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework import parsers, renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# A Fragment is encoded as this string first, then swapped for its bytes.
+MARKER = '\x00fragment\x00'
+ENCODED_MARKER = json.dumps(MARKER).encode()
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if orjson is not None else 0
+)
+
+
+class Fragment:
+    """A JSON value encoded once and spliced into every response.
+
+    ``value`` stays available for renderers that cannot splice, such as
+    the indented output of the browsable API.
+    """
+
+    __slots__ = ('value', 'encoded')
+
+    def __init__(self, value, encoded=None):
+        self.value = value
+        self.encoded = encode(value) if encoded is None else encoded
+
+
+class FragmentEncoder(encoders.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Fragment):
+            return obj.value
+        return super().default(obj)
+
+
+def escape_separators(content):
+    # Same as JSONRenderer: keep the output a strict JavaScript subset.
+    return content.replace(
+        '\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def dumps_json(data, default):
+    return json.dumps(
+        data, cls=FragmentEncoder, default=default, ensure_ascii=False,
+        allow_nan=False, separators=(',', ':'),
+    ).encode()
+
+
+def has_floats(data):
+    # Decimals count as well: the encoder turns them into floats.
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+            stack.extend(value)
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, (float, Decimal)):
+            return True
+    return False
+
+
+def dumps_orjson(data, default):
+    # orjson spells some floats its own way (1e-5 for 1e-05) and writes
+    # NaN as null: documents with floats go to the standard library.
+    if has_floats(data):
+        return dumps_json(data, default)
+    return orjson.dumps(data, default=default, option=ORJSON_OPTIONS)
+
+
+def get_dumps():
+    name = getattr(settings, 'JSON_ENCODER', 'orjson')
+    if name == 'orjson' and orjson is not None:
+        return dumps_orjson
+    return dumps_json
+
+
+dumps = get_dumps()
+fallback = FragmentEncoder().default
+
+
+def encode(data):
+    """Encode ``data`` like the compact ``JSONRenderer``, splicing fragments.
+
+    Fragments go through the encoder as a marker string that is replaced
+    by their bytes afterwards. Should the data contain the marker itself,
+    it is encoded again with the fragment values instead.
+    """
+    fragments = []
+
+    def default(obj):
+        if isinstance(obj, Fragment):
+            fragments.append(obj.encoded)
+            return MARKER
+        return fallback(obj)
+
+    try:
+        content = dumps(data, default)
+    except TypeError:
+        if dumps is dumps_json:
+            raise
+        # orjson rejects integers beyond 64 bits; the standard library
+        # also raises the stock error for an object it cannot encode.
+        fragments.clear()
+        content = dumps_json(data, default)
+    if fragments:
+        parts = content.split(ENCODED_MARKER)
+        if len(parts) != len(fragments) + 1:
+            return escape_separators(dumps(data, fallback))
+        chunks = [parts[0]]
+        for fragment, part in zip(fragments, parts[1:]):
+            chunks.append(fragment)
+            chunks.append(part)
+        content = b''.join(chunks)
+    return escape_separators(content)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """``JSONRenderer`` with a faster encoder and pre-encoded fragments.
+
+    Compact output is byte-identical to ``JSONRenderer``; orjson is used
+    when installed unless ``JSON_ENCODER = 'json'``, except for data with
+    floats or integers beyond 64 bits, which orjson writes differently
+    or not at all. Indented and ASCII output falls back to the stock
+    renderer.
+    """
+
+    encoder_class = FragmentEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (data is None or self.ensure_ascii or not self.compact
+                or not self.strict or self.get_indent(
+                    accepted_media_type, renderer_context or {}) is not None):
+            return super().render(
+                data, accepted_media_type, renderer_context)
+        return encode(data)
+
+
+class FastJSONParser(parsers.JSONParser):
+    """``JSONParser`` that decodes UTF-8 bodies with orjson if installed."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # The stock parser accepts a few inputs orjson does not, such
+            # as integers beyond 64 bits, and words its errors its own way.
+            return super().parse(
+                io.BytesIO(body), media_type, parser_context)
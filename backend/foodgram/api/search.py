@@ -0,0 +1,238 @@
+import bisect
+import heapq
+import threading
+import time
+from array import array
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from recipes.models import Ingredient, IngredientNumber
+
+from .cache import get_version
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class IngredientIndex:
+    """Process-local index for ingredient name autocomplete.
+
+    Names are kept in a sorted array, so a prefix lookup is two bisects,
+    and a trigram posting list narrows substring lookups to a handful of
+    candidates. Results follow the API order: prefix matches first, then
+    substring matches, both by descending name.
+    """
+
+    def __init__(self, ttl=None, namespace=None):
+        self.ttl = ttl
+        # Cache version namespace: a bump from any process, such as an
+        # import, makes the index stale.
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        self.built_at = None
+
+    def current_version(self):
+        return self.namespace and get_version(self.namespace)
+
+    def is_stale(self):
+        return self.built_at is None or (
+            self.ttl is not None
+            and time.monotonic() - self.built_at > self.ttl
+        ) or self.version != self.current_version()
+
+    def build(self):
+        self.version = self.current_version()
+        rows = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit')
+        items = sorted(
+            ({'id': pk, 'name': name, 'measurement_unit': unit}
+             for pk, name, unit in rows),
+            key=lambda item: (item['name'].lower(), item['id']),
+        )
+        keys = [item['name'].lower() for item in items]
+        postings = {}
+        for position, key in enumerate(keys):
+            for trigram in trigrams(key):
+                postings.setdefault(trigram, []).append(position)
+        # Published in one write: searches running during a rebuild keep
+        # reading the snapshot they started with.
+        self.snapshot = IngredientSnapshot(items, keys, postings)
+        self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.is_stale():
+            with self.lock:
+                if self.is_stale():
+                    self.build()
+        return self.snapshot
+
+    def search(self, name, limit=None):
+        snapshot = self.ensure_built()
+        text = name.lower()
+        prefix = snapshot.prefix_range(text)
+        result = snapshot.ordered(prefix)
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        result.extend(snapshot.ordered(
+            position for position in snapshot.substring_positions(text)
+            if position not in prefix
+        ))
+        return result if limit is None else result[:limit]
+
+
+class IngredientSnapshot(
+        namedtuple('IngredientSnapshot', ('items', 'keys', 'postings'))):
+    """One build of ``IngredientIndex``; never changed once published."""
+
+    __slots__ = ()
+
+    def prefix_range(self, prefix):
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', lo=start)
+        return range(start, end)
+
+    def substring_positions(self, text):
+        if len(text) < 3:
+            return [
+                position for position, key in enumerate(self.keys)
+                if text in key
+            ]
+        candidates = None
+        for trigram in sorted(
+                trigrams(text), key=lambda t: len(self.postings.get(t, ()))):
+            posting = self.postings.get(trigram)
+            if not posting:
+                return []
+            candidates = (
+                set(posting) if candidates is None
+                else candidates.intersection(posting)
+            )
+        return [
+            position for position in candidates
+            if text in self.keys[position]
+        ]
+
+    def ordered(self, positions):
+        return sorted(
+            (self.items[position] for position in positions),
+            key=lambda item: item['name'],
+            reverse=True,
+        )
+
+
+ingredient_index = IngredientIndex(
+    ttl=getattr(settings, 'INGREDIENT_INDEX_TTL', None),
+    namespace='ingredients')
+
+
+class RankedRecipes:
+    """Lazily ordered ``(recipe id, matched, missing)`` rows.
+
+    Slicing selects only the requested page with a heap, so a page from
+    the top of a large result is not paid for with a full sort.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(len(self.rows))
+        page = heapq.nsmallest(stop, self.rows)[start:]
+        return [(-key[-1], matched, missing) for key, matched, missing in page]
+
+
+class RecipeIngredientIndex:
+    """Process-local inverted index from ingredients to recipes.
+
+    Every ingredient keeps an integer array of the recipes that use it, so
+    ranking recipes by the ingredients at hand is a count over a few
+    arrays instead of a scan of ``IngredientNumber``. Writes update single
+    recipes; the TTL rebuild picks up changes made by other processes.
+    """
+
+    orderings = ('ratio', 'missing')
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        self.built_at = None
+
+    def is_stale(self):
+        return self.built_at is None or (
+            self.ttl is not None
+            and time.monotonic() - self.built_at > self.ttl
+        )
+
+    def build(self):
+        postings, recipes = {}, {}
+        rows = IngredientNumber.objects.order_by().values_list(
+            'ingredient_id', 'recipe_id').iterator(chunk_size=10000)
+        for ingredient_id, recipe_id in rows:
+            postings.setdefault(ingredient_id, array('l')).append(recipe_id)
+            recipes.setdefault(recipe_id, array('l')).append(ingredient_id)
+        self.postings, self.recipes = postings, recipes
+        self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.is_stale():
+            with self.lock:
+                if self.is_stale():
+                    self.build()
+
+    def update(self, recipe_ids):
+        if self.built_at is None:
+            return
+        current = {}
+        rows = IngredientNumber.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', 'ingredient_id')
+        for recipe_id, ingredient_id in rows:
+            current.setdefault(recipe_id, array('l')).append(ingredient_id)
+        with self.lock:
+            for recipe_id in recipe_ids:
+                for ingredient_id in self.recipes.pop(recipe_id, ()):
+                    self.postings[ingredient_id].remove(recipe_id)
+                ingredients = current.get(recipe_id)
+                if ingredients:
+                    self.recipes[recipe_id] = ingredients
+                    for ingredient_id in ingredients:
+                        self.postings.setdefault(
+                            ingredient_id, array('l')).append(recipe_id)
+
+    def match(self, ingredient_ids, ordering='ratio'):
+        """Rank the recipes that use any of the given ingredients.
+
+        ``ratio`` puts the best covered recipes first, ``missing`` the ones
+        that need the fewest extra ingredients; ties go to newer recipes.
+        """
+        self.ensure_built()
+        matched = Counter()
+        with self.lock:
+            for ingredient_id in set(ingredient_ids):
+                matched.update(self.postings.get(ingredient_id, ()))
+            sizes = {pk: len(self.recipes[pk]) for pk in matched}
+        if ordering == 'missing':
+            rows = [
+                ((sizes[pk] - count, -count, -pk), count, sizes[pk] - count)
+                for pk, count in matched.items()
+            ]
+        else:
+            rows = [
+                ((-count / sizes[pk], sizes[pk] - count, -pk), count,
+                 sizes[pk] - count)
+                for pk, count in matched.items()
+            ]
+        return RankedRecipes(rows)
+
+
+recipe_ingredient_index = RecipeIngredientIndex(
+    ttl=getattr(settings, 'RECIPE_INGREDIENT_INDEX_TTL', None))
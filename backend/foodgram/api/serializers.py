@@ -1,26 +1,69 @@
-import base64
-import uuid
-
-from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
 from djoser import serializers as djoser_serializers
 from recipes.models import (Favorite, Follow, Ingredient, IngredientNumber,
-                            Recipe, ShoppingCart, Tag)
+                            Recipe, ShoppingCart, ShoppingListExport, Tag)
 from rest_framework import serializers
 from users.models import User
 
+from .images import check_upload, decode_base64_image, resolve_upload_token
+from .relations import relation_cache
+
+
+def get_recipes_limit(request):
+    limit = request and request.query_params.get('recipes_limit')
+    if limit and limit.isdigit():
+        return int(limit)
+    return None
+
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            id = uuid.uuid4()
-            data = ContentFile(
-                base64.b64decode(imgstr),
-                name=id.urn[9:] + '.' + ext)
+            data = decode_base64_image(data)
+        elif isinstance(data, str):
+            return resolve_upload_token(data, self.context['request'].user)
         return super().to_internal_value(data)
 
 
+class ThumbnailImageField(Base64ImageField):
+    """Image URL of the thumbnail that fits the rendering context.
+
+    The size comes from ``image_size`` in the serializer context, falling
+    back to ``default_size``; the original file is used until the
+    thumbnail has been generated.
+    """
+
+    def __init__(self, default_size='detail', **kwargs):
+        self.default_size = default_size
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        self.thumbnails = getattr(instance, 'image_thumbnails', None) or {}
+        return super().get_attribute(instance)
+
+    def to_representation(self, value):
+        size = self.context.get('image_size', self.default_size)
+        if (not value or not self.use_url
+                or self.thumbnails.get('source') != value.name
+                or size not in self.thumbnails):
+            return super().to_representation(value)
+        url = default_storage.url(self.thumbnails[size])
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class ImageUploadSerializer(serializers.Serializer):
+    image = serializers.ImageField()
+
+    def validate_image(self, image):
+        check_upload(image)
+        return image
+
+
 class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -43,7 +86,8 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class RecipeMiniOutputSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(use_url=True, allow_null=True)
+    image = ThumbnailImageField(
+        default_size='card', use_url=True, allow_null=True)
 
     class Meta:
         model = Recipe
@@ -83,11 +127,10 @@ class UserSerializer(djoser_serializers.UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, author):
-        request = self.context['request']
-        return (
-            request.user.is_authenticated
-            and author.follower.filter(user=request.user).exists()
-        )
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        return relation_cache.contains(
+            self.context['request'], 'following', author.id)
 
     class Meta(djoser_serializers.UserSerializer.Meta):
         model = User
@@ -109,11 +152,16 @@ class UserRecipeSerializer(UserSerializer):
         read_only_fields = fields
 
     def get_recipes(self, user_object):
-        queryset = user_object.recipes.all()
+        queryset = getattr(user_object, 'recipe_previews', None)
+        if queryset is None:
+            queryset = user_object.recipes.order_by('-id')
+            limit = get_recipes_limit(self.context.get('request'))
+            if limit is not None:
+                queryset = queryset[:limit]
         return RecipeMiniOutputSerializer(queryset, many=True).data
 
     def get_recipes_count(self, user_object):
-        return user_object.recipes.count()
+        return user_object.recipes_count
 
 
 class IngredientNumberSerializer(serializers.ModelSerializer):
@@ -133,6 +181,11 @@ class IngredientNumberSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class IngredientAmountSerializer(serializers.Serializer):
+    id = serializers.IntegerField(source='ingredient')
+    amount = serializers.IntegerField(source='number')
+
+
 class ShoppingCartSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -144,6 +197,14 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         return RecipeMiniOutputSerializer(instance, context=self.context).data
 
 
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ShoppingListExport
+        fields = ('id', 'status', 'file', 'updated')
+        read_only_fields = fields
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -168,14 +229,30 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
         many=True, queryset=Tag.objects.all()
     )
-    ingredients = IngredientNumberSerializer(
+    ingredients = IngredientAmountSerializer(
         source='ingredient_number',
         many=True
     )
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        if request is not None:
+            instance = Recipe.objects.with_user_flags(request.user).get(
+                pk=instance.pk)
         return RecipeListSerializer(instance, context=self.context).data
 
+    def validate_ingredients(self, ingredients):
+        found = Ingredient.objects.in_bulk(
+            {obj['ingredient'] for obj in ingredients})
+        missing = sorted(
+            {obj['ingredient'] for obj in ingredients} - set(found))
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}')
+        for obj in ingredients:
+            obj['ingredient'] = found[obj['ingredient']]
+        return ingredients
+
     def validate(self, data):
         if len(data['tags']) == 0:
             raise serializers.ValidationError(
@@ -205,13 +282,50 @@ class RecipeSerializer(serializers.ModelSerializer):
         return super().validate(data)
 
     def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            IngredientNumber.objects.create(
+        IngredientNumber.objects.bulk_create(
+            IngredientNumber(
                 recipe=recipe,
                 number=ingredient.get('number'),
                 ingredient=ingredient.get('ingredient')
             )
+            for ingredient in ingredients
+        )
+
+    def update_ingredients(self, ingredients, recipe):
+        current = {
+            obj.ingredient_id: obj for obj in recipe.ingredient_number.all()
+        }
+        numbers = {
+            ingredient['ingredient'].id: ingredient['number']
+            for ingredient in ingredients
+        }
+        recipe.ingredient_number.filter(
+            ingredient_id__in=set(current) - set(numbers)
+        ).delete()
+        changed = []
+        for ingredient_id, obj in current.items():
+            number = numbers.get(ingredient_id)
+            if number is not None and number != obj.number:
+                obj.number = number
+                changed.append(obj)
+        IngredientNumber.objects.bulk_update(changed, ('number',))
+        self.create_ingredients(
+            (
+                ingredient for ingredient in ingredients
+                if ingredient['ingredient'].id not in current
+            ),
+            recipe
+        )
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if isinstance(image, TemporaryUploadedFile):
+                image.close()
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredient_number')
         tags = validated_data.pop('tags')
@@ -220,13 +334,11 @@ class RecipeSerializer(serializers.ModelSerializer):
         self.create_ingredients(ingredients, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         if 'ingredient_number' in validated_data:
-            ingredient_number = validated_data.pop('ingredient_number')
-            if 'ingredient_number':
-                recipe.ingredients.clear()
-            RecipeSerializer.create_ingredients(
-                self, ingredient_number, recipe
+            self.update_ingredients(
+                validated_data.pop('ingredient_number'), recipe
             )
         return super().update(recipe, validated_data)
 
@@ -235,7 +347,7 @@ class RecipeListSerializer(serializers.ModelSerializer):
     author = UserSerializer(
         default=serializers.CurrentUserDefault(),
     )
-    image = Base64ImageField(use_url=True)
+    image = ThumbnailImageField(use_url=True)
     ingredients = IngredientNumberSerializer(
         source='ingredient_number', many=True,
     )
@@ -254,19 +366,23 @@ class RecipeListSerializer(serializers.ModelSerializer):
             IngredientNumber.objects.filter(recipe=obj), many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user,
-            recipe=obj
-        ).exists()
+        return request is not None and relation_cache.contains(
+            request, 'favorite', obj.id)
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=request.user,
-            recipe=obj
-        ).exists()
+        return request is not None and relation_cache.contains(
+            request, 'shopping_cart', obj.id)
+
+
+class RecipeMatchSerializer(RecipeListSerializer):
+    matched = serializers.IntegerField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeListSerializer.Meta):
+        fields = RecipeListSerializer.Meta.fields + ('matched', 'missing')
@@ -0,0 +1,127 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.models import Follow, Ingredient, IngredientNumber, Recipe, Tag
+from recipes.signals import being_deleted
+from users.models import User
+
+from .cache import bump_version
+from .feed import backfill, schedule_fan_out, unfollow
+from .images import schedule_thumbnails
+from .relations import RELATIONS, relation_cache
+from .search import ingredient_index, recipe_ingredient_index
+
+
+def refresh_ingredients():
+    ingredient_index.invalidate()
+    bump_version('ingredients')
+
+
+# Invalidating before the commit would let a concurrent request cache the
+# old rows under the new version.
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    transaction.on_commit(refresh_ingredients)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    transaction.on_commit(lambda: bump_version('tags'))
+
+
+# Fields of a user that recipe payloads show as the author.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+def invalidate_recipes():
+    transaction.on_commit(lambda: bump_version('recipes'))
+
+
+def touch_recipes(recipe_ids):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now())
+    invalidate_recipes()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(raw=False, **kwargs):
+    if not raw:
+        invalidate_recipes()
+
+
+@receiver((post_save, post_delete), sender=IngredientNumber)
+def touch_recipe_ingredients(instance, raw=False, **kwargs):
+    if not raw and not being_deleted(Recipe, instance.recipe_id):
+        touch_recipes((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        touch_recipes((instance.pk,))
+    elif pk_set:
+        touch_recipes(pk_set)
+    else:
+        # A tag cleared from its side does not say which recipes it left.
+        transaction.on_commit(lambda: bump_version('tags'))
+
+
+@receiver(post_save, sender=User)
+def invalidate_authors(update_fields=None, raw=False, **kwargs):
+    if not raw and (update_fields is None or AUTHOR_FIELDS & update_fields):
+        transaction.on_commit(lambda: bump_version('users'))
+
+
+@receiver(post_save, sender=Recipe)
+def make_recipe_thumbnails(instance, raw=False, **kwargs):
+    if not raw:
+        schedule_thumbnails(instance)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientNumber)
+def update_recipe_ingredients(instance, raw=False, **kwargs):
+    if not raw:
+        recipe_id = getattr(instance, 'recipe_id', instance.pk)
+        transaction.on_commit(
+            lambda: recipe_ingredient_index.update((recipe_id,)))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        schedule_fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_timeline(instance, **kwargs):
+    unfollow(instance.user_id, instance.author_id)
+
+
+def connect_relation(relation, model):
+
+    def changed(instance, raw=False, **kwargs):
+        if not raw:
+            user_id = instance.user_id
+            transaction.on_commit(
+                lambda: relation_cache.invalidate(user_id, relation))
+
+    post_save.connect(
+        changed, sender=model, weak=False,
+        dispatch_uid=f'relation_{relation}_saved')
+    post_delete.connect(
+        changed, sender=model, weak=False,
+        dispatch_uid=f'relation_{relation}_deleted')
+
+
+for relation, (model, _) in RELATIONS.items():
+    connect_relation(relation, model)
@@ -0,0 +1,1038 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models.signals import post_delete
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from PIL import Image
+from recipes import fulltext, trending
+from recipes.models import (Favorite, Follow, Ingredient, IngredientNumber,
+                            Recipe, ShoppingCart, Tag)
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from users.models import User
+
+from . import checks, exports, feed, images, renderers
+from .async_views import PooledASGIHandler, pooled_view
+from .fast_serializers import FastRecipeListSerializer
+from .instrumentation import Probe, current_probe
+from .relations import LocMemBackend, relation_cache
+from .renderers import FastJSONRenderer, Fragment
+from .search import IngredientIndex, ingredient_index
+from .search import trigrams as search_trigrams
+from .serializers import RecipeListSerializer, TagSerializer
+
+
+class APITestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов')
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='Читатель', last_name='Рецептов')
+        cls.tags = [
+            Tag.objects.create(
+                id=number, name=f'Тег {number}', color=color,
+                slug=f'tag-{number}')
+            for number, (color, _) in enumerate(Tag.COLOR_CHOICES, 1)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5)
+        ]
+        cls.recipes = []
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.author if number % 2 else cls.user,
+                name=f'Рецепт {number}', text='Описание',
+                cooking_time=number + 1)
+            recipe.tags.set(cls.tags[:number % 3 + 1])
+            IngredientNumber.objects.bulk_create(
+                IngredientNumber(
+                    recipe=recipe, ingredient=ingredient, number=number + 1)
+                for ingredient in cls.ingredients[:number % 4 + 1]
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        backend = relation_cache.backend
+        relation_cache.backend = LocMemBackend()
+        self.addCleanup(setattr, relation_cache, 'backend', backend)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_recipe(self, recipe):
+        return self.client.get(f'/api/recipes/{recipe.id}/').json()
+
+
+class RelationCacheTests(APITestCase):
+
+    def test_favorite_and_cart_show_after_commit(self):
+        recipe = self.recipes[1]
+        self.assertFalse(self.get_recipe(recipe)['is_favorited'])
+        self.assertFalse(self.get_recipe(recipe)['is_in_shopping_cart'])
+        for action, flag in (
+            ('favorite', 'is_favorited'),
+            ('shopping_cart', 'is_in_shopping_cart'),
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    f'/api/recipes/{recipe.id}/{action}/')
+            self.assertEqual(response.status_code, 201)
+            self.assertTrue(self.get_recipe(recipe)[flag])
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.delete(
+                    f'/api/recipes/{recipe.id}/{action}/')
+            self.assertEqual(response.status_code, 204)
+            self.assertFalse(self.get_recipe(recipe)[flag])
+
+    def test_subscribe_shows_after_commit(self):
+        recipe = self.recipes[1]
+        self.assertFalse(self.get_recipe(recipe)['author']['is_subscribed'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(self.get_recipe(recipe)['author']['is_subscribed'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(self.get_recipe(recipe)['author']['is_subscribed'])
+
+    def test_rolled_back_write_keeps_cached_set(self):
+        key = relation_cache.key(self.user.id, 'favorite')
+        relation_cache.load(self.user.id, 'favorite')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(relation_cache.backend.get(key), {0})
+
+    def test_load_racing_a_commit_does_not_store_old_set(self):
+        key = relation_cache.key(self.user.id, 'shopping_cart')
+        generation = relation_cache.backend.generation(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingCart.objects.create(
+                user=self.user, recipe=self.recipes[0])
+        relation_cache.backend.set(key, set(), generation)
+        self.assertIsNone(relation_cache.backend.get(key))
+        self.assertEqual(
+            relation_cache.load(self.user.id, 'shopping_cart'),
+            {self.recipes[0].id})
+        self.assertEqual(
+            relation_cache.backend.get(key), {0, self.recipes[0].id})
+
+    def test_follow_invalidates_follower_only(self):
+        relation_cache.load(self.user.id, 'following')
+        relation_cache.load(self.author.id, 'following')
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.user, author=self.author)
+        self.assertIsNone(relation_cache.backend.get(
+            relation_cache.key(self.user.id, 'following')))
+        self.assertIsNotNone(relation_cache.backend.get(
+            relation_cache.key(self.author.id, 'following')))
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+
+    def errors(self):
+        return [message.id for message in checks.check_relation_cache(None)]
+
+    @override_settings(WEB_CONCURRENCY=4, RELATION_CACHE={
+        'BACKEND': 'api.relations.LocMemBackend'})
+    def test_local_relation_cache_fails_with_several_workers(self):
+        self.assertEqual(self.errors(), ['api.E001'])
+
+    @override_settings(WEB_CONCURRENCY=1, RELATION_CACHE={
+        'BACKEND': 'api.relations.LocMemBackend'})
+    def test_local_relation_cache_passes_with_one_worker(self):
+        self.assertEqual(self.errors(), [])
+
+    @override_settings(WEB_CONCURRENCY=4, RELATION_CACHE={
+        'BACKEND': 'api.relations.RedisBackend'})
+    def test_shared_relation_cache_passes_with_several_workers(self):
+        self.assertEqual(self.errors(), [])
+
+    @override_settings(WEB_CONCURRENCY=4, CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_response_cache_fails_with_several_workers(self):
+        self.assertEqual(
+            [message.id for message in checks.check_response_cache(None)],
+            ['api.E002'])
+
+    @override_settings(WEB_CONCURRENCY=4, CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_table'}})
+    def test_shared_response_cache_passes_with_several_workers(self):
+        self.assertEqual(checks.check_response_cache(None), [])
+
+
+class RecipeCacheTests(APITestCase):
+
+    def test_saving_a_recipe_keeps_other_detail_pages_cached(self):
+        recipe, other = self.recipes[:2]
+        self.get_recipe(recipe)
+        self.get_recipe(other)
+        with self.captureOnCommitCallbacks(execute=True):
+            other.name = 'Новое название'
+            other.save()
+        # Only the updated_at lookup; the relation sets are loaded.
+        with self.assertNumQueries(1):
+            self.get_recipe(recipe)
+        self.assertEqual(self.get_recipe(other)['name'], 'Новое название')
+
+    def test_changing_ingredients_refreshes_detail_page(self):
+        recipe = self.recipes[3]
+        self.get_recipe(recipe)
+        amount = IngredientNumber.objects.filter(recipe=recipe).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            amount.number = 777
+            amount.save()
+        self.assertIn(
+            777, [item['amount']
+                  for item in self.get_recipe(recipe)['ingredients']])
+
+
+class ReferenceCacheTests(APITestCase):
+
+    def test_ingredient_changes_invalidate_after_commit(self):
+        ingredient = self.ingredients[0]
+        self.client.get('/api/ingredients/')
+        ingredient_index.ensure_built()
+        with self.captureOnCommitCallbacks() as callbacks:
+            ingredient.name = 'Новое название'
+            ingredient.save()
+        self.assertEqual(cache.get('ingredients:version'), 1)
+        self.assertFalse(ingredient_index.is_stale())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cache.get('ingredients:version'), 2)
+        self.assertIn('Новое название', [
+            item['name'] for item in self.client.get(
+                '/api/ingredients/', {'name': 'нов'}).json()])
+
+    def test_tag_changes_invalidate_after_commit(self):
+        tag = self.tags[0]
+        self.client.get('/api/tags/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            tag.name = 'Новый тег'
+            tag.save()
+        self.assertEqual(cache.get('tags:version'), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            self.client.get(f'/api/tags/{tag.id}/').json()['name'],
+            'Новый тег')
+
+
+class CounterTests(APITestCase):
+
+    def test_deleting_a_recipe_skips_updates_of_the_recipe(self):
+        recipe = self.recipes[5]
+        for number in range(20):
+            user = User.objects.create(
+                email=f'fan{number}@example.com', username=f'fan{number}')
+            Favorite.objects.create(user=user, recipe=recipe)
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+        with CaptureQueriesContext(connection) as queries:
+            recipe.delete()
+        self.assertEqual([
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "recipes_recipe"')
+        ], [])
+        self.assertLess(len(queries), 30)
+        self.author.refresh_from_db()
+        self.assertEqual(
+            self.author.recipes_count,
+            Recipe.objects.filter(author=self.author).count())
+
+    def test_failed_delete_does_not_stop_later_updates(self):
+        recipe = self.recipes[5]
+        Favorite.objects.create(user=self.user, recipe=recipe)
+
+        def fail(**kwargs):
+            raise RuntimeError
+
+        post_delete.connect(fail, sender=ShoppingCart)
+        self.addCleanup(post_delete.disconnect, fail, sender=ShoppingCart)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            recipe.delete()
+        post_delete.disconnect(fail, sender=ShoppingCart)
+        Favorite.objects.get(user=self.user, recipe=recipe).delete()
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.popularity), (0, 1))
+
+    def test_deleting_a_favorite_updates_counters(self):
+        recipe = self.recipes[5]
+        favorite = Favorite.objects.create(user=self.user, recipe=recipe)
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.popularity), (1, 1))
+        favorite.delete()
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.popularity,
+             recipe.trending_score), (0, 0, 0))
+
+
+class TrendingTests(APITestCase):
+
+    def test_removing_a_favorite_later_leaves_no_residue(self):
+        recipe = self.recipes[5]
+        favorite = Favorite.objects.create(user=self.user, recipe=recipe)
+        later = favorite.created_at + timedelta(hours=2)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            favorite.delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.trending_score, 0)
+
+    def test_recompute_decays_events_by_window(self):
+        now = timezone.now()
+        recent, older, stale = self.recipes[:3]
+        for recipe, age in (
+            (recent, timedelta(minutes=5)),
+            (older, timedelta(hours=30)),
+            (stale, timedelta(days=30)),
+        ):
+            favorite = Favorite.objects.create(user=self.user, recipe=recipe)
+            Favorite.objects.filter(pk=favorite.pk).update(
+                created_at=now - age)
+        ShoppingCart.objects.create(user=self.user, recipe=recent)
+        ShoppingCart.objects.filter(user=self.user).update(
+            created_at=now - timedelta(minutes=5))
+        self.assertEqual(trending.recompute(now=now), 2)
+        scores = dict(Recipe.objects.filter(trending_score__gt=0).values_list(
+            'pk', 'trending_score'))
+        # 30 hours old counts in the 24 hour to 3 day window.
+        self.assertEqual(scores, {
+            recent.pk: 2.0,
+            older.pk: round(trending.window_weight(24 * 60 * 60), 6),
+        })
+        self.assertEqual(trending.recompute(now=now), 0)
+
+    def test_trending_ordering(self):
+        for number, recipe in enumerate(self.recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                trending_score=number % 4 / 2)
+        expected = list(Recipe.objects.order_by(
+            '-trending_score', '-id').values_list('id', flat=True))
+        for params in ({'limit': 100}, {'pagination': 'cursor'}):
+            with self.subTest(params=params):
+                response = self.client.get(
+                    '/api/recipes/', {'ordering': 'trending', **params})
+                self.assertEqual(
+                    [item['id'] for item in response.json()['results']],
+                    expected[:len(response.json()['results'])])
+
+
+class FeedTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Run the background work inline, on the test's connection.
+        for name, value in (
+            ('BACKFILL', 2),
+            ('close_old_connections', lambda: None),
+            ('executor', mock.Mock(submit=lambda task, *args: task(*args))),
+        ):
+            patcher = mock.patch.object(feed, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def feed_ids(self):
+        response = self.client.get('/api/recipes/feed/?limit=100')
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_new_follower_gets_every_fanned_out_recipe(self):
+        Recipe.objects.filter(author=self.author).update(in_timelines=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(self.feed_ids(), list(
+            Recipe.objects.filter(author=self.author)
+            .order_by('-id').values_list('id', flat=True)))
+
+    def test_unfollow_before_older_copy_leaves_no_entries(self):
+        Recipe.objects.filter(author=self.author).update(in_timelines=True)
+        feed.copy_older(self.user.id, self.author.id)
+        self.assertFalse(feed.TimelineEntry.objects.filter(
+            user=self.user).exists())
+
+    def test_entries_of_a_racing_fan_out_stay_out_of_the_feed(self):
+        Recipe.objects.filter(author=self.author).update(in_timelines=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        # A fan-out that read the followers before the unfollow committed
+        # inserts its entry after the unfollow has cleaned up.
+        feed.TimelineEntry.objects.create(
+            user=self.user, recipe=self.recipes[1])
+        self.assertEqual(self.feed_ids(), [])
+
+
+def png_header(width, height):
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data)))
+
+    return b'\x89PNG\r\n\x1a\n' + chunk(
+        b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    ) + chunk(b'IEND', b'')
+
+
+class RecipeImageTests(APITestCase):
+
+    def post_image(self, content):
+        return self.client.post('/api/recipes/', {
+            'name': 'Рецепт с картинкой',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 1}],
+            'image': 'data:image/png;base64,'
+            + base64.b64encode(content).decode(),
+        }, format='json')
+
+    def test_decompression_bomb_is_rejected(self):
+        response = self.post_image(png_header(20000, 20000))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+
+    def test_truncated_header_is_rejected(self):
+        for content in (b'\x89PNG\r\n\x1a\n\x00\x00', png_header(1, 1)[:20]):
+            response = self.post_image(content)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('image', response.json())
+
+    @mock.patch.object(images, 'DECODE_CHUNK', 10)
+    def test_line_wrapped_base64_is_decoded(self):
+        content = bytes(range(256)) * 3
+        file = io.BytesIO()
+        size = images.write_decoded(
+            file, base64.encodebytes(content).decode())
+        self.assertEqual((size, file.getvalue()), (len(content), content))
+        with self.assertRaises(ValidationError):
+            images.write_decoded(io.BytesIO(), 'AAA*\nAAAA')
+
+    def test_replaced_image_leaves_no_old_thumbnails(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        patcher = mock.patch.object(
+            images, 'close_old_connections', lambda: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        recipe = self.recipes[1]
+        thumbnails = []
+        for name in ('recipes/old.png', 'recipes/new.png'):
+            output = io.BytesIO()
+            Image.new('RGB', (8, 8)).save(output, 'PNG')
+            default_storage.save(name, ContentFile(output.getvalue()))
+            Recipe.objects.filter(pk=recipe.pk).update(image=name)
+            images.make_thumbnails(recipe.pk, name)
+            recipe.refresh_from_db()
+            thumbnails.append([
+                path for size, path in recipe.image_thumbnails.items()
+                if size != 'source'])
+        old, new = thumbnails
+        self.assertEqual(len(new), len(images.THUMBNAIL_SIZES))
+        for path in old:
+            self.assertFalse(default_storage.exists(path))
+        for path in new:
+            self.assertTrue(default_storage.exists(path))
+
+
+class RecipeIngredientUpdateTests(APITestCase):
+
+    def patch(self, recipe, ingredients):
+        self.client.force_authenticate(recipe.author)
+        return self.client.patch(f'/api/recipes/{recipe.id}/', {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'tags': [tag.id for tag in recipe.tags.all()],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+        }, format='json')
+
+    def rows(self, recipe):
+        return {
+            row.ingredient_id: (row.pk, row.number)
+            for row in IngredientNumber.objects.filter(recipe=recipe)
+        }
+
+    def test_only_changed_rows_are_written(self):
+        recipe = self.recipes[3]
+        first, second, third, dropped, added = self.ingredients
+        before = self.rows(recipe)
+        response = self.patch(
+            recipe, ((first, 4), (second, 9), (third, 4), (added, 2)))
+        self.assertEqual(response.status_code, 200)
+        after = self.rows(recipe)
+        self.assertEqual(
+            {pk: number for pk, (_, number) in after.items()},
+            {first.id: 4, second.id: 9, third.id: 4, added.id: 2})
+        for pk in (first.id, second.id, third.id):
+            self.assertEqual(after[pk][0], before[pk][0])
+        self.assertNotIn(dropped.id, after)
+
+    def test_unknown_ingredient_is_rejected(self):
+        recipe = self.recipes[3]
+        before = self.rows(recipe)
+        unknown = Ingredient(id=10 ** 6, name='Нет', measurement_unit='г')
+        response = self.patch(
+            recipe, ((self.ingredients[0], 1), (unknown, 1)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(unknown.id), str(response.json()['ingredients']))
+        self.assertEqual(self.rows(recipe), before)
+
+
+class SerializationTimingTests(APITestCase):
+
+    def probed(self, url):
+        probe = Probe()
+        token = current_probe.set(probe)
+        try:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        finally:
+            current_probe.reset(token)
+        return probe
+
+    def test_view_serializers_are_timed(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipes[0].id}/',
+                    '/api/tags/'):
+            self.assertGreater(self.probed(url).serialization_time, 0)
+
+    def test_serializer_classes_are_left_alone(self):
+        self.probed('/api/recipes/')
+        probe = Probe()
+        token = current_probe.set(probe)
+        try:
+            serializer = TagSerializer(self.tags[0])
+            serializer.data
+        finally:
+            current_probe.reset(token)
+        self.assertIs(type(serializer), TagSerializer)
+        self.assertEqual(probe.serialization_time, 0)
+
+
+class PooledViewTests(TestCase):
+
+    def test_queries_in_pool_threads_reach_the_probe(self):
+        def view(request):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return HttpResponse()
+
+        probe = Probe()
+        token = current_probe.set(probe)
+        try:
+            response = asyncio.run(
+                pooled_view(view)(RequestFactory().get('/')))
+        finally:
+            current_probe.reset(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(probe.queries, 1)
+
+    def test_streamed_body_is_produced_chunk_by_chunk_in_the_pool(self):
+        threads = []
+
+        def chunks():
+            for chunk in (b'a', b'b', b'c'):
+                threads.append(threading.current_thread().name)
+                yield chunk
+
+        def view(request):
+            return StreamingHttpResponse(chunks())
+
+        async def serve():
+            response = await pooled_view(view)(RequestFactory().get('/'))
+            self.assertEqual(threads, [])
+
+            async def send(message):
+                sent.append(message)
+
+            await PooledASGIHandler().send_response(response, send)
+
+        sent = []
+        asyncio.run(serve())
+        self.assertEqual(sent[0]['type'], 'http.response.start')
+        self.assertEqual(
+            [message.get('body') for message in sent[1:]],
+            [b'a', b'b', b'c', None])
+        self.assertFalse(sent[-1].get('more_body', False))
+        self.assertEqual(len(threads), 3)
+        for name in threads:
+            self.assertTrue(name.startswith('async-views'))
+
+
+class ShoppingListDownloadTests(APITestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def test_errors_are_json_whatever_the_format(self):
+        self.client.force_authenticate(None)
+        for accept in ('application/pdf', 'text/plain', 'text/csv'):
+            response = self.client.get(self.url, HTTP_ACCEPT=accept)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn('detail', response.json())
+
+    def test_list_is_rendered_in_the_negotiated_format(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[3])
+        response = self.client.get(self.url, HTTP_ACCEPT='text/plain')
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Ингредиент 0 (г) — 4', content)
+
+    def test_pdf_font_declares_widths_of_every_code(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[3])
+        response = self.client.get(self.url, HTTP_ACCEPT='application/pdf')
+        content = b''.join(response.streaming_content)
+        font = re.search(
+            rb'/FirstChar (\d+) /LastChar (\d+) /Widths \[([\d ]+)\]',
+            content)
+        first, last = int(font[1]), int(font[2])
+        widths = [int(width) for width in font[3].split()]
+        self.assertEqual((first, last, len(widths)), (32, 255, 224))
+        # Latin and Cyrillic capitals share their Arial widths.
+        for latin, cyrillic in (('A', 'А'), ('H', 'Н'), ('O', 'О')):
+            self.assertEqual(
+                widths[ord(latin) - first],
+                widths[cyrillic.encode('cp1251')[0] - first])
+
+
+class RecipeFilterTests(APITestCase):
+
+    def ids(self, params, status_code=200):
+        response = self.client.get('/api/recipes/', {'limit': 100, **params})
+        self.assertEqual(response.status_code, status_code)
+        return sorted(recipe['id'] for recipe in response.json()['results'])
+
+    def numbered(self, condition):
+        return sorted(
+            recipe.id for number, recipe in enumerate(self.recipes)
+            if condition(number))
+
+    def test_user_relation_flags(self):
+        for recipe in self.recipes[::3]:
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        for recipe in self.recipes[::4]:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        for flag, step in (('is_favorited', 3), ('is_in_shopping_cart', 4)):
+            with self.subTest(flag=flag):
+                self.assertEqual(
+                    self.ids({flag: 1}),
+                    self.numbered(lambda number: number % step == 0))
+                self.assertEqual(
+                    self.ids({flag: 0}),
+                    self.numbered(lambda number: number % step != 0))
+
+    def test_anonymous_user_has_no_favorites(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        self.client.force_authenticate(None)
+        self.assertEqual(self.ids({'is_favorited': 1}), [])
+        self.assertEqual(
+            self.ids({'is_favorited': 0}),
+            [recipe.id for recipe in self.recipes])
+        self.assertEqual(self.ids({'is_in_shopping_cart': 1}), [])
+
+    def test_author_and_tags(self):
+        self.assertEqual(
+            self.ids({'author': self.author.id}),
+            self.numbered(lambda number: number % 2))
+        self.assertEqual(
+            self.ids({'tags': 'tag-3'}),
+            self.numbered(lambda number: number % 3 == 2))
+        # Several tags match recipes with any of them, each recipe once.
+        self.assertEqual(
+            self.ids({'tags': ['tag-2', 'tag-3']}),
+            self.numbered(lambda number: number % 3))
+
+    def test_invalid_values_are_rejected(self):
+        for params in (
+            {'is_favorited': 'yes'},
+            {'is_in_shopping_cart': 2},
+            {'author': 'автор'},
+            {'tags': 'no-such-tag'},
+            {'ordering': 'random'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get('/api/recipes/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.json())
+
+
+class ImportDataTests(APITestCase):
+
+    def write(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        with open(path, 'w', encoding='UTF-8') as data:
+            data.write(content)
+        return path
+
+    def import_data(self, **options):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'import_data', stdout=stdout, stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_import_refreshes_cached_ingredients(self):
+        self.client.get('/api/ingredients/')
+        self.client.get('/api/ingredients/', {'name': 'карда'})
+        self.import_data(path=self.write('ingredients.csv', 'кардамон,г\n'))
+        for params in ({}, {'name': 'карда'}):
+            with self.subTest(params=params):
+                self.assertIn('кардамон', [
+                    item['name'] for item in self.client.get(
+                        '/api/ingredients/', params).json()])
+
+    def test_recipe_ids_taken_by_other_recipes_are_skipped(self):
+        taken = self.recipes[0]
+        tags = set(taken.tags.all())
+        amounts = set(taken.ingredient_number.values_list(
+            'ingredient_id', 'number'))
+        rows = [
+            {'id': taken.id, 'author': self.author.id, 'name': 'Чужой',
+             'text': 'Описание', 'cooking_time': 5, 'image': '',
+             'tags': [self.tags[3].id],
+             'ingredients': [{'id': self.ingredients[4].id, 'amount': 7}]},
+            {'id': 1000, 'author': self.author.id, 'name': 'Новый',
+             'text': 'Описание', 'cooking_time': 5, 'image': '',
+             'tags': [self.tags[3].id],
+             'ingredients': [{'id': self.ingredients[4].id, 'amount': 7}]},
+        ]
+        path = self.write('recipes.json', json.dumps(rows))
+        self.get_recipe(taken)
+        errors = self.import_data(model='recipes', path=path)
+        self.assertIn(str(taken.id), errors)
+        self.assertEqual(set(taken.tags.all()), tags)
+        self.assertEqual(set(taken.ingredient_number.values_list(
+            'ingredient_id', 'number')), amounts)
+        self.assertEqual(self.get_recipe(taken)['name'], taken.name)
+        added = self.client.get('/api/recipes/1000/').json()
+        self.assertEqual(
+            [item['amount'] for item in added['ingredients']], [7])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 7)
+        # A second run finds the imported recipe and reports nothing.
+        self.assertNotIn('1000', self.import_data(model='recipes', path=path))
+        self.assertEqual(
+            IngredientNumber.objects.filter(recipe_id=1000).count(), 1)
+
+
+class CursorPaginationTests(APITestCase):
+
+    def walk(self, params):
+        ids = []
+        response = self.client.get(
+            '/api/recipes/', {'pagination': 'cursor', 'limit': 5, **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.json()['results'])
+            if response.json()['next'] is None:
+                return ids
+            response = self.client.get(response.json()['next'])
+
+    def test_next_links_visit_every_recipe_once(self):
+        self.assertEqual(
+            self.walk({}), sorted(
+                (recipe.id for recipe in self.recipes), reverse=True))
+
+    def test_popular_ties_are_broken_by_id(self):
+        for number, recipe in enumerate(self.recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                popularity=number % 3)
+        self.assertEqual(
+            self.walk({'ordering': 'popular'}),
+            list(Recipe.objects.order_by(
+                '-popularity', '-id').values_list('id', flat=True)))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get('/api/recipes/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ShoppingListExportTests(APITestCase):
+    url = '/api/recipes/shopping_cart_export/'
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        # Rendering runs when the test says so, on the test's connection.
+        self.queued = []
+        for name, value in (
+            ('render_pdf', lambda rows: b'%PDF'),
+            ('close_old_connections', lambda: None),
+            ('executor', mock.Mock(submit=lambda task, *args: (
+                self.queued.append((task, args))))),
+        ):
+            patcher = mock.patch.object(exports, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_queued(self):
+        while self.queued:
+            task, args = self.queued.pop(0)
+            task(*args)
+
+    def test_export_is_polled_until_done(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[3])
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 202)
+        status_url = f'{self.url}{response.json()["id"]}/'
+        self.assertEqual(self.client.get(status_url).status_code, 202)
+        self.run_queued()
+        response = self.client.get(status_url)
+        self.assertEqual(response.status_code, 303)
+        self.assertTrue(response['Location'].endswith('.pdf'))
+        # An unchanged cart reuses the rendered file.
+        self.assertEqual(self.client.post(self.url).status_code, 303)
+        self.assertEqual(self.queued, [])
+
+    def test_finishing_an_export_keeps_pending_ones(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[3])
+        first = self.client.post(self.url).json()['id']
+        self.run_queued()
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[4])
+        second = self.client.post(self.url).json()['id']
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[5])
+        third = self.client.post(self.url).json()['id']
+        task, args = self.queued.pop()
+        task(*args)
+        self.assertEqual(
+            self.client.get(f'{self.url}{second}/').status_code, 202)
+        self.assertEqual(
+            self.client.get(f'{self.url}{first}/').status_code, 404)
+        self.run_queued()
+        self.assertEqual(
+            self.client.get(f'{self.url}{second}/').status_code, 303)
+        self.assertEqual(
+            self.client.get(f'{self.url}{third}/').status_code, 303)
+
+
+class RecipeQueryBudgetTests(APITestCase):
+    # Count, page, authors, tags and ingredients; an authenticated user
+    # adds the favorite, cart and follow sets of the relation cache.
+    budgets = {False: 5, True: 8}
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        for authenticated, budget in self.budgets.items():
+            self.client.force_authenticate(
+                self.user if authenticated else None)
+            for limit in (6, 100):
+                with self.subTest(authenticated=authenticated, limit=limit):
+                    cache.clear()
+                    relation_cache.backend = LocMemBackend()
+                    with self.assertNumQueries(budget):
+                        response = self.client.get(
+                            f'/api/recipes/?limit={limit}')
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(
+                        len(response.json()['results']),
+                        min(limit, len(self.recipes)))
+
+
+class FastRecipeListSerializerTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number, recipe in enumerate(cls.recipes):
+            if number % 3:
+                recipe.image = f'recipes/{number}.png'
+            if number % 3 == 1:
+                recipe.image_thumbnails = {
+                    'source': recipe.image.name,
+                    'card': f'recipes/{number}_card.webp',
+                    'detail': f'recipes/{number}_detail.webp',
+                }
+            recipe.save()
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def test_output_matches_recipe_list_serializer(self):
+        for user in (AnonymousUser(), self.user):
+            request = Request(APIRequestFactory().get('/api/recipes/'))
+            request.user = user
+            for offset in range(0, len(self.recipes), 5):
+                queryset = Recipe.objects.with_user_flags(user).order_by(
+                    '-id')[offset:offset + 5]
+                for image_size in ('card', 'detail'):
+                    context = {'request': request, 'image_size': image_size}
+                    with self.subTest(
+                            user=user, offset=offset, image_size=image_size):
+                        self.assertEqual(
+                            FastJSONRenderer().render(
+                                FastRecipeListSerializer(
+                                    queryset.all(), context=context).data),
+                            JSONRenderer().render(RecipeListSerializer(
+                                queryset.all(), many=True,
+                                context=context).data),
+                        )
+
+
+class FastJSONRendererTests(TestCase):
+    documents = (
+        [1e-05, 1e+20, 1e16, 0.1, -0.0, 2.5],
+        {'amount': Decimal('0.5'), 1.5: 'float key', 2: 'int key'},
+        [2 ** 70, -2 ** 70, 2 ** 63],
+        {'name': 'строка\x00\x1f\x7f"\\', 'lines': 'a\u2028b\u2029c'},
+        {'id': uuid.UUID(int=1), 'at': datetime(2026, 1, 2, 3, 4, 5)},
+        [('tuple', None, True)],
+    )
+    encoders = {'json': renderers.dumps_json}
+    if renderers.orjson is not None:
+        encoders['orjson'] = renderers.dumps_orjson
+
+    def assert_same_render(self, data, expected=None):
+        expected = data if expected is None else expected
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_output_matches_json_renderer(self):
+        for name, dumps in self.encoders.items():
+            with mock.patch.object(renderers, 'dumps', dumps):
+                for data in self.documents:
+                    with self.subTest(encoder=name, data=data):
+                        self.assert_same_render(data)
+
+    def test_fragments_render_as_their_value(self):
+        for name, dumps in self.encoders.items():
+            with mock.patch.object(renderers, 'dumps', dumps):
+                for value in self.documents:
+                    with self.subTest(encoder=name, value=value):
+                        inner = Fragment({'values': value})
+                        self.assert_same_render(
+                            [Fragment(value), {'nested': inner}, value],
+                            [value, {'nested': {'values': value}}, value])
+
+    def test_invalid_values_raise_like_json_renderer(self):
+        for name, dumps in self.encoders.items():
+            with mock.patch.object(renderers, 'dumps', dumps):
+                for value in (float('nan'), float('inf'), object()):
+                    with self.subTest(encoder=name, value=value):
+                        with self.assertRaises(Exception) as expected:
+                            JSONRenderer().render([value])
+                        with self.assertRaises(type(expected.exception)):
+                            FastJSONRenderer().render([value])
+
+
+class RecipeSearchTests(APITestCase):
+
+    def test_search_with_cursor_pagination_is_rejected(self):
+        for params in (
+            {'search': 'рецепт', 'pagination': 'cursor'},
+            {'search': 'рецепт', 'cursor': 'cD0x'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get('/api/recipes/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('search', response.json())
+        response = self.client.get(
+            '/api/recipes/', {'search': 'рецепт', 'limit': 3})
+        self.assertEqual(response.status_code, 200)
+
+    def create_soups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            in_name = Recipe.objects.create(
+                author=self.author, name='Борщ', text='Описание',
+                cooking_time=60)
+            in_text = Recipe.objects.create(
+                author=self.author, name='Суп', text='Почти как Борщ',
+                cooking_time=30)
+        return in_name, in_text
+
+    def test_name_matches_rank_above_text_matches(self):
+        # The text match is newer, so ordering by id alone would put it
+        # first.
+        in_name, in_text = self.create_soups()
+        response = self.client.get('/api/recipes/', {'search': 'борщ'})
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [in_name.id, in_text.id])
+
+    def test_search_falls_back_to_icontains_on_other_backends(self):
+        in_name, in_text = self.create_soups()
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            found = fulltext.search(Recipe.objects.all(), 'Борщ')
+            self.assertEqual(
+                set(found.values_list('id', flat=True)),
+                {in_name.id, in_text.id})
+
+
+class IngredientIndexTests(SimpleTestCase):
+
+    def test_rebuild_during_a_search_keeps_its_results(self):
+        # Catalogues of different sizes: mixing the positions of one with
+        # the names of the other returns the wrong rows or fails.
+        catalogues = [
+            [(pk, f'соль {pk}', 'г') for pk in range(size)]
+            + [(1000 + pk, f'перец {pk}', 'г') for pk in range(size)]
+            for size in (300, 50)
+        ]
+        rows = iter(catalogues)
+        index = IngredientIndex()
+        with mock.patch.object(
+                Ingredient.objects, 'values_list',
+                side_effect=lambda *fields: next(rows)):
+            index.build()
+            expected = index.search('оль')
+            rebuilt = []
+
+            def trigrams(text):
+                # Another thread rebuilds between the prefix lookup and
+                # the substring lookup of this search.
+                if not rebuilt:
+                    rebuilt.append(True)
+                    index.build()
+                return search_trigrams(text)
+
+            with mock.patch('api.search.trigrams', trigrams):
+                self.assertEqual(index.search('оль'), expected)
+        self.assertEqual(rebuilt, [True])
+        self.assertEqual(len(index.search('оль')), 50)
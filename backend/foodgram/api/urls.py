@@ -1,9 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 from djoser.views import TokenDestroyView, UserViewSet
 from rest_framework import routers
 
+from .async_views import pooled_patterns
 from .views import (IngredientViewSet, RecipeViewSet, TagViewSet,
-                    TokenCreateView, UserRecipeViewSet)
+                    TokenCreateView, UserRecipeViewSet, metrics)
 
 router = routers.DefaultRouter()
 router.register(r'recipes', RecipeViewSet, basename='recipes')
@@ -12,6 +14,7 @@ router.register(r'tags', TagViewSet, basename='tags')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path(r'metrics/', metrics, name='metrics'),
     path(r'auth/token/login/', TokenCreateView.as_view(), name='login'),
     path(r'auth/token/logout/', TokenDestroyView.as_view(), name='logout'),
     path(r'users/', UserViewSet.as_view(
@@ -35,3 +38,9 @@ urlpatterns = [
         name='subscribe',
     ),
 ]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = [
+        path('', include(pooled_patterns(router.urls))),
+        *pooled_patterns(urlpatterns[1:]),
+    ]
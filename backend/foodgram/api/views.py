@@ -1,29 +1,44 @@
-import pdfkit
-from django.db.models import Sum
-from django.db.models.query_utils import Q
-from django.http import Http404, HttpResponse, JsonResponse
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db.models import BooleanField, OuterRef, Prefetch, Subquery, Value
+from django.http import (Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
-from django.template.loader import get_template
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import views
-from recipes.models import (Favorite, Follow, Ingredient, IngredientNumber,
-                            Recipe, ShoppingCart, Tag)
+from recipes.models import (Favorite, Follow, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListExport, Tag)
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.mixins import (CreateModelMixin, DestroyModelMixin,
                                    ListModelMixin, RetrieveModelMixin)
 from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.parsers import FileUploadParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 from users.models import User
 from users.permissions import IsAuthorOrReadOnly
 
-from .filters import TagRecipeFilter
+from .cache import CachedRecipeMixin, CachedResponseMixin
+from .exporters import get_exporters
+from .exports import get_shopping_list, request_export
+from .fast_serializers import FastRecipeListSerializer
+from .feed import feed_queryset
+from .filters import RECIPE_ORDERINGS, RecipeFilter
+from .images import save_upload
+from .instrumentation import (OPTIONS, TimedSerializerMixin, prometheus_text,
+                              registry, timed)
+from .pagination import LimitOffsetOrCursorPagination, OptionalCursorPagination
+from .renderers import FastJSONRenderer
+from .search import ingredient_index, recipe_ingredient_index
 from .serializers import (FavoriteSerializer, FollowSerializer,
-                          IngredientSerializer, RecipeListSerializer,
+                          ImageUploadSerializer, IngredientSerializer,
+                          RecipeListSerializer, RecipeMatchSerializer,
                           RecipeSerializer, ShoppingCartSerializer,
-                          TagSerializer, UserRecipeSerializer)
+                          ShoppingListExportSerializer, TagSerializer,
+                          UserRecipeSerializer, get_recipes_limit)
 
 
 class CreateListDestroyViewSet(
@@ -40,14 +55,20 @@ class TokenCreateView(views.TokenCreateView):
         return response
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+        TimedSerializerMixin, CachedRecipeMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     edit_permission_classes = (IsAuthorOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
-    pagination_class = LimitOffsetPagination
-    filterset_class = TagRecipeFilter
+    pagination_class = LimitOffsetOrCursorPagination
+    filterset_class = RecipeFilter
     serializer_class = RecipeListSerializer
     edit_serializer_class = RecipeSerializer
+    fast_serializer_class = FastRecipeListSerializer
+    fast_actions = ('list', 'feed') if getattr(
+        settings, 'RECIPE_FAST_SERIALIZER', True) else ()
+    exporter_actions = ('download_shopping_cart',)
+    error_renderer_class = FastJSONRenderer
 
     def get_permissions(self):
         if self.action in (
@@ -66,39 +87,47 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.edit_serializer_class
         return super().get_serializer_class()
 
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.fast_actions and kwargs.get('many'):
+            return timed(self.fast_serializer_class(
+                *args, context=self.get_serializer_context()))
+        return super().get_serializer(*args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        if self.action in self.fast_actions:
+            queryset = self.fast_serializer_class.rows(queryset)
+        return super().paginate_queryset(queryset)
+
+    def handle_exception(self, exc):
+        if self.action in self.exporter_actions:
+            # Errors are JSON, not a document in the negotiated format.
+            self.request.accepted_renderer = self.error_renderer_class()
+            self.request.accepted_media_type = (
+                self.request.accepted_renderer.media_type)
+        return super().handle_exception(exc)
+
+    def get_cursor_ordering(self):
+        if self.request.query_params.get('search'):
+            # A cursor pages by column values, and the search rank is not
+            # a column; it would silently fall back to the newest first.
+            raise ValidationError(
+                {'search': 'Поиск не поддерживает pagination=cursor'})
+        if self.action == 'list':
+            return RECIPE_ORDERINGS.get(
+                self.request.query_params.get('ordering'))
+        return None
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'cook', 'feed'):
+            context['image_size'] = 'card'
+        return context
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
-        user = self.request.user
-        is_favorited = self.request.query_params.get('is_favorited')
-        if is_favorited:
-            recipes_id = (
-                Favorite.objects.filter(user=user).values('recipe__id')
-                if user.is_authenticated
-                else []
-            )
-            condition = Q(id__in=recipes_id)
-            queryset = queryset.filter(
-                condition if is_favorited == '1' else ~condition
-            ).all()
-        is_in_shopping_cart = self.request.query_params.get(
-            'is_in_shopping_cart')
-        if is_in_shopping_cart:
-            recipes_id = (
-                ShoppingCart.objects.filter(user=user).values('recipe__id')
-                if user.is_authenticated
-                else []
-            )
-            condition = Q(id__in=recipes_id)
-            queryset = queryset.filter(
-                condition if is_in_shopping_cart == '1' else ~condition
-            ).all()
-        author_id = self.request.query_params.get('author')
-        if author_id:
-            return (queryset.filter(author__id=author_id).all())
-        return queryset
+        return Recipe.objects.with_user_flags(self.request.user)
 
     @action(detail=True,
             methods=['post', 'delete'],
@@ -153,53 +182,141 @@ class RecipeViewSet(viewsets.ModelViewSet):
                         status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, permission_classes=[IsAuthenticated, ])
-    def download_shopping_cart(self, request):
-        queryset = (
-            IngredientNumber.objects.filter(
-                recipe__shopping_cart__user=request.user
+    def feed(self, request):
+        queryset = feed_queryset(
+            self.filter_queryset(self.get_queryset()), request.user)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False)
+    def cook(self, request):
+        ingredient_ids = [
+            value.strip()
+            for values in request.query_params.getlist('ingredients')
+            for value in values.split(',')
+        ]
+        if not ingredient_ids or not all(
+                value.isdigit() for value in ingredient_ids):
+            raise ValidationError(
+                {'ingredients': 'Укажите id ингредиентов через запятую'})
+        ordering = request.query_params.get('ordering', 'ratio')
+        if ordering not in recipe_ingredient_index.orderings:
+            raise ValidationError({'ordering': 'Допустимо: ratio, missing'})
+        paginator = LimitOffsetPagination()
+        page = paginator.paginate_queryset(
+            recipe_ingredient_index.match(
+                map(int, ingredient_ids), ordering),
+            request, view=self,
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        results = []
+        for recipe_id, matched, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched, recipe.missing = matched, missing
+                results.append(recipe)
+        serializer = RecipeMatchSerializer(
+            results, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False,
+            methods=['post'],
+            permission_classes=[IsAuthenticated, ],
+            parser_classes=(MultiPartParser, FileUploadParser)
             )
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(Sum('number'))
+    def upload_image(self, request):
+        serializer = ImageUploadSerializer(
+            data={'image': request.data.get('image', request.data.get('file'))}
         )
-        user = request.user
-        data = {
-            'page_objects': queryset,
-            'user': user,
-        }
-        template = get_template('shopping_cart.html')
-        html = template.render(data)
-        shopping_list_print = pdfkit.from_string(
-            html, False, options={'encoding': 'UTF-8'})
-        response = HttpResponse(shopping_list_print,
-                                'content_type=application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="shoplist.pdf"'
+        serializer.is_valid(raise_exception=True)
+        token = save_upload(
+            serializer.validated_data['image'], request.user)
+        return Response({'token': token}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False,
+            permission_classes=[IsAuthenticated, ],
+            renderer_classes=get_exporters()
+            )
+    def download_shopping_cart(self, request):
+        exporter = request.accepted_renderer
+        # One row per ingredient, read here: pooled ASGI views produce
+        # the streamed document after this thread's connection is closed.
+        rows = get_shopping_list(request.user)
+        content_type = exporter.media_type
+        if exporter.charset:
+            content_type += f'; charset={exporter.charset}'
+        response = StreamingHttpResponse(
+            exporter.stream(rows), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shoplist.{exporter.format}"')
         return response
 
+    @action(detail=False,
+            methods=['post'],
+            permission_classes=[IsAuthenticated, ]
+            )
+    def shopping_cart_export(self, request):
+        export = request_export(
+            request.user, get_shopping_list(request.user))
+        return self.export_response(export)
+
+    @action(detail=False,
+            url_path=r'shopping_cart_export/(?P<export_id>\d+)',
+            permission_classes=[IsAuthenticated, ]
+            )
+    def shopping_cart_export_status(self, request, export_id):
+        export = get_object_or_404(
+            ShoppingListExport, id=export_id, user=request.user)
+        return self.export_response(export)
+
+    def export_response(self, export):
+        serializer = ShoppingListExportSerializer(
+            export, context=self.get_serializer_context())
+        if export.status == ShoppingListExport.DONE:
+            return Response(
+                serializer.data,
+                status=status.HTTP_303_SEE_OTHER,
+                headers={'Location': serializer.data['file']},
+            )
+        if export.status == ShoppingListExport.PENDING:
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        return Response(serializer.data)
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(
+        TimedSerializerMixin, CachedResponseMixin,
+        viewsets.ReadOnlyModelViewSet):
+    queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
+    cache_namespace = 'ingredients'
 
-    def get_queryset(self):
-        queryset = Ingredient.objects.all()
-        name = self.request.query_params.get('name')
-        if name is not None:
-            begin = queryset.filter(name__istartswith=name)
-            contain = queryset.filter(
-                ~Q(name__istartswith=name) & Q(name__icontains=name)
-            )
-            queryset = list(begin) + list(contain)
-            return queryset
-        return queryset
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            if not limit.isdigit() or int(limit) == 0:
+                raise ValidationError(
+                    {'limit': 'Должно быть целым положительным числом'})
+            limit = int(limit)
+        return Response(ingredient_index.search(name, limit))
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(
+        TimedSerializerMixin, CachedResponseMixin,
+        viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    cache_namespace = 'tags'
 
 
 class UserRecipeViewSet(
+    TimedSerializerMixin,
     mixins.CreateModelMixin,
     mixins.DestroyModelMixin,
     mixins.ListModelMixin,
@@ -207,6 +324,7 @@ class UserRecipeViewSet(
 ):
     serializer_class = UserRecipeSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = OptionalCursorPagination
 
     def get_author(self) -> User:
         return get_object_or_404(User, id=self.kwargs.get('author_id'))
@@ -234,9 +352,25 @@ class UserRecipeViewSet(
         return super().get_serializer_class()
 
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            return User.objects.filter(follower__user=self.request.user)
-        return None
+        if not self.request.user.is_authenticated:
+            return None
+        recipes = Recipe.objects.only(
+            'id', 'author_id', 'name', 'image', 'image_thumbnails',
+            'cooking_time',
+        ).order_by('-id')
+        limit = get_recipes_limit(self.request)
+        if limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(author=OuterRef('author'))
+                .order_by('-id').values('id')[:limit]
+            ))
+        return User.objects.filter(
+            follower__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recipe_previews')
+        )
 
     def create(self, request, *args, **kwargs):
         request.data.update(author=self.get_author())
@@ -251,3 +385,15 @@ class UserRecipeViewSet(
 
     def perform_create(self, serializer):
         serializer.save(author=self.get_author())
+
+
+def metrics(request):
+    if not OPTIONS['ENABLED']:
+        raise Http404
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR')
+            in OPTIONS['METRICS_ALLOWED_IPS']):
+        raise PermissionDenied
+    return HttpResponse(
+        prometheus_text(registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
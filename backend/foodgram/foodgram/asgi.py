@@ -0,0 +1,23 @@
+"""
+ASGI config for Foodgram project.
+
+It exposes the ASGI callable as a module-level variable named ``application``
+and serves the I/O-heavy API views from ``api.async_views``. Run it with
+``gunicorn foodgram.asgi:application -k uvicorn.workers.UvicornWorker``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
+
+django.setup(set_prefix=False)
+
+from api.async_views import PooledASGIHandler  # noqa: E402
+
+application = PooledASGIHandler()
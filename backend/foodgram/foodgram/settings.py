@@ -45,6 +45,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.instrumentation.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -163,7 +164,132 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# JSON encoder of api.renderers.FastJSONRenderer: 'orjson' when installed,
+# or the standard library 'json'
+
+JSON_ENCODER = 'orjson'
+
+# Number of server processes; gunicorn reads the same variable.
+
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# Cached responses and their namespace versions (api.cache). Version
+# bumps land in this cache, so with the per-process LocMemCache the other
+# workers keep serving old pages with valid ETags. Use a shared backend,
+# e.g. CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache with
+# CACHE_LOCATION=cache_table (after `manage.py createcachetable`), or
+# memcached, whenever WEB_CONCURRENCY is above 1; `manage.py check`
+# fails otherwise.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    },
+}
+
+# Cached responses for tags and ingredients, and anonymous recipe pages
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+RECIPE_CACHE_TIMEOUT = 10 * 60
+
+# Recipe image limits and thumbnails
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_DIMENSION = 6000
+RECIPE_THUMBNAIL_SIZES = {
+    'card': (480, 480),
+    'detail': (1200, 1200),
 }
+RECIPE_IMAGE_WORKERS = 2
+RECIPE_IMAGE_UPLOAD_MAX_AGE = 24 * 60 * 60
+
+# Shopping list export workers and download formats
+
+SHOPPING_LIST_EXPORT_WORKERS = 2
+SHOPPING_LIST_EXPORT_TIMEOUT = 60
+SHOPPING_LIST_EXPORTERS = (
+    'api.exporters.PdfExporter',
+    'api.exporters.TextExporter',
+    'api.exporters.CsvExporter',
+)
+
+# Per-user follow, favorite and shopping cart sets. LocMemBackend keeps
+# them in one process: a write invalidates only that process, and the
+# others answer from stale sets for up to TIMEOUT. It is only correct
+# with a single worker; set REDIS_URL (RedisBackend) to share the sets
+# between workers. `manage.py check` fails on LocMemBackend with more
+# than one WEB_CONCURRENCY worker.
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+RELATION_CACHE = {
+    'BACKEND': 'api.relations.LocMemBackend',
+    'TIMEOUT': 60 * 60,
+}
+if REDIS_URL:
+    RELATION_CACHE.update(
+        BACKEND='api.relations.RedisBackend', LOCATION=REDIS_URL)
+
+# Ingredient autocomplete index
+
+INGREDIENT_INDEX_TTL = 300
+
+# Ingredient to recipe index for the "what can I cook" search
+
+RECIPE_INGREDIENT_INDEX_TTL = 300
+
+# Per-view query and latency instrumentation (off unless ENABLED)
+
+INSTRUMENTATION = {
+    'ENABLED': os.getenv('INSTRUMENTATION_ENABLED', '') == '1',
+    'WINDOW': 1000,
+    'N_PLUS_ONE_THRESHOLD': 10,
+    'SNAPSHOT_DIR': os.getenv('INSTRUMENTATION_SNAPSHOT_DIR'),
+    'FLUSH_INTERVAL': 10,
+    'METRICS_ALLOWED_IPS': ('127.0.0.1',),
+}
+
+# Followed authors feed: fan-out on write up to this many followers. A
+# new follower gets the latest FEED_BACKFILL recipes of the author at
+# once and the older ones from a background worker.
+
+FEED_FANOUT_LIMIT = 1000
+FEED_BACKFILL = 100
+FEED_WORKERS = 2
+
+# Recipe full-text search (PostgreSQL text search configuration)
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+# Trending recipes: favorites and shopping cart additions of the last
+# week, halving in weight every day (seconds). Run recompute_trending
+# periodically, e.g. every 15 minutes, to apply the decay.
+
+TRENDING_HALF_LIFE = 24 * 60 * 60
+TRENDING_WINDOWS = (
+    60 * 60, 6 * 60 * 60, 24 * 60 * 60, 3 * 24 * 60 * 60, 7 * 24 * 60 * 60,
+)
+
+# Async views for the ASGI entry point (foodgram.asgi turns them on):
+# the I/O-heavy API views run on a pool of worker threads instead of
+# Django's single thread for sync views.
+
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', '') == '1'
+ASYNC_VIEW_WORKERS = int(os.getenv('ASYNC_VIEW_WORKERS', 16))
 
 DJOSER = {
     'SERIALIZERS': {
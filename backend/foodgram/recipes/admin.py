@@ -10,12 +10,12 @@ class RecipeIngredientInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorite')
     list_filter = ('author', 'name', 'tags')
     inlines = (RecipeIngredientInline, )
 
     def favorite(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 class IngredientAdmin(admin.ModelAdmin):
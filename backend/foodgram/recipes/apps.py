@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class RecipeConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from .signals import connect_counters, connect_search, connect_trending
+        connect_counters()
+        connect_search()
+        connect_trending()
@@ -0,0 +1,66 @@
+from django.apps import apps as global_apps
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+# (source model, foreign key on it, counted model, counter field)
+COUNTERS = (
+    ('recipes.Favorite', 'recipe', 'recipes.Recipe', 'favorites_count'),
+    ('recipes.ShoppingCart', 'recipe', 'recipes.Recipe',
+     'shopping_cart_count'),
+    ('recipes.Recipe', 'author', 'users.User', 'recipes_count'),
+    ('recipes.Follow', 'author', 'users.User', 'followers_count'),
+)
+# (model, total field, counter fields it sums)
+TOTALS = (
+    ('recipes.Recipe', 'popularity',
+     ('favorites_count', 'shopping_cart_count')),
+)
+TOTALLED = {
+    (label, field): total
+    for label, total, fields in TOTALS for field in fields
+}
+
+
+def change_counter(model, pk, field, delta):
+    fields = [field]
+    total = TOTALLED.get((model._meta.label, field))
+    if total is not None:
+        fields.append(total)
+    model.objects.filter(pk=pk).update(
+        **{name: Greatest(F(name) + delta, 0) for name in fields})
+
+
+def actual_count(source, foreign_key):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{foreign_key: OuterRef('pk')})
+            .order_by()
+            .values(foreign_key)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def recount(apps=global_apps, batch_size=1000):
+    """Recompute every counter column and return the drifted row counts."""
+    drift = {}
+    for source, foreign_key, target, field in COUNTERS:
+        source = apps.get_model(source)
+        target = apps.get_model(target)
+        rows = (
+            target.objects.annotate(actual=actual_count(source, foreign_key))
+            .exclude(**{field: F('actual')})
+            .values_list('pk', 'actual')
+        )
+        changed = [target(pk=pk, **{field: actual}) for pk, actual in rows]
+        target.objects.bulk_update(changed, (field,), batch_size=batch_size)
+        drift[f'{target.__name__}.{field}'] = len(changed)
+    for target, field, fields in TOTALS:
+        target = apps.get_model(target)
+        actual = sum((F(name) for name in fields[1:]), F(fields[0]))
+        drift[f'{target.__name__}.{field}'] = target.objects.exclude(
+            **{field: actual}).update(**{field: actual})
+    return drift
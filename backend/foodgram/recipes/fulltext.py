@@ -0,0 +1,142 @@
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+CONFIG = getattr(settings, 'RECIPE_SEARCH_CONFIG', 'russian')
+FTS_TABLE = 'recipes_recipe_fts'
+BATCH_SIZE = 500
+# bm25() weights of the name, ingredients and text columns.
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+INGREDIENT_NAMES = (
+    'SELECT {aggregate} FROM recipes_ingredientnumber AS n '
+    'JOIN recipes_ingredient AS i ON i.id = n.ingredient_id '
+    'WHERE n.recipe_id = r.id'
+)
+POSTGRES_UPDATE = (
+    'UPDATE recipes_recipe AS r SET search_vector = '
+    "setweight(to_tsvector(%s::regconfig, r.name), 'A') || "
+    "setweight(to_tsvector(%s::regconfig, coalesce(("
+    + INGREDIENT_NAMES.format(aggregate="string_agg(i.name, ' ')")
+    + "), '')), 'B') || "
+    "setweight(to_tsvector(%s::regconfig, r.text), 'C')"
+)
+SQLITE_INSERT = (
+    f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+    'SELECT r.id, r.name, coalesce(('
+    + INGREDIENT_NAMES.format(aggregate="group_concat(i.name, ' ')")
+    + "), ''), r.text FROM recipes_recipe AS r"
+)
+
+
+def create_index(connection):
+    """Create the search storage for the recipe name, text and ingredients.
+
+    PostgreSQL keeps a weighted ``tsvector`` column with a GIN index on
+    ``recipes_recipe``; SQLite keeps an FTS5 table keyed by the recipe id.
+    The column is not part of the model, so other backends keep working
+    and fall back to ``icontains`` lookups.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector')
+            cursor.execute(
+                'CREATE INDEX recipes_recipe_search_vector '
+                'ON recipes_recipe USING gin (search_vector)'
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE {FTS_TABLE} USING '
+                f"fts5(name, ingredients, text, tokenize='unicode61')"
+            )
+
+
+def drop_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('DROP INDEX recipes_recipe_search_vector')
+            cursor.execute(
+                'ALTER TABLE recipes_recipe DROP COLUMN search_vector')
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'DROP TABLE {FTS_TABLE}')
+
+
+def refresh_batch(connection, recipe_ids):
+    recipes = entries = ''
+    params = []
+    if recipe_ids is not None:
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        recipes = f' WHERE r.id IN ({placeholders})'
+        entries = f' WHERE rowid IN ({placeholders})'
+        params = list(recipe_ids)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_UPDATE + recipes, [CONFIG] * 3 + params)
+        else:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}{entries}', params)
+            cursor.execute(SQLITE_INSERT + recipes, params)
+
+
+def refresh(recipe_ids=None, using=DEFAULT_DB_ALIAS):
+    """Rebuild the search entries of the given recipes, or of all of them.
+
+    Ids of deleted recipes are fine: their entries are simply dropped.
+    """
+    connection = connections[using]
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    if recipe_ids is None:
+        refresh_batch(connection, None)
+        return
+    recipe_ids = sorted(set(recipe_ids))
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        refresh_batch(connection, recipe_ids[start:start + BATCH_SIZE])
+
+
+def search(queryset, query):
+    """Filter recipes by ``query`` and order them by relevance.
+
+    Every word of the query must match as a prefix in the name, the
+    ingredient names or the text; matches in the name rank highest.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        params = (CONFIG, tsquery)
+        queryset = queryset.filter(RawSQL(
+            'recipes_recipe.search_vector @@ to_tsquery(%s::regconfig, %s)',
+            params, output_field=BooleanField(),
+        )).annotate(search_rank=RawSQL(
+            'ts_rank(recipes_recipe.search_vector, '
+            'to_tsquery(%s::regconfig, %s))',
+            params, output_field=FloatField(),
+        ))
+    elif vendor == 'sqlite':
+        # Joining the FTS table lets bm25() be computed in the same scan as
+        # MATCH; a correlated subquery would rerun the match per row.
+        match = ' '.join(f'"{word}"*' for word in words)
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        queryset = queryset.extra(
+            select={'search_rank': f'-bm25({FTS_TABLE}, {weights})'},
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = recipes_recipe.id',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[match],
+        )
+    else:
+        for word in words:
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(text__icontains=word)
+                | Q(ingredients__name__icontains=word)
+            ).distinct()
+        return queryset
+    return queryset.order_by('-search_rank', '-id')
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (source model, foreign key on it, counted model, counter field)
+COUNTERS = (
+    ('recipes.Favorite', 'recipe', 'recipes.Recipe', 'favorites_count'),
+    ('recipes.ShoppingCart', 'recipe', 'recipes.Recipe',
+     'shopping_cart_count'),
+    ('recipes.Recipe', 'author', 'users.User', 'recipes_count'),
+    ('recipes.Follow', 'author', 'users.User', 'followers_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for source, foreign_key, target, field in COUNTERS:
+        source = apps.get_model(source)
+        counted = (
+            source.objects.filter(**{foreign_key: OuterRef('pk')})
+            .order_by()
+            .values(foreign_key)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        apps.get_model(target).objects.update(**{field: Coalesce(
+            Subquery(counted, output_field=IntegerField()), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_shoppinglistexport'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
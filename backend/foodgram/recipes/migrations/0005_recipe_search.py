@@ -0,0 +1,59 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:40
+
+from django.db import migrations
+
+INGREDIENT_NAMES = (
+    'SELECT {aggregate} FROM recipes_ingredientnumber AS n '
+    'JOIN recipes_ingredient AS i ON i.id = n.ingredient_id '
+    'WHERE n.recipe_id = r.id'
+)
+POSTGRES_FORWARD = (
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    'CREATE INDEX recipes_recipe_search_vector '
+    'ON recipes_recipe USING gin (search_vector)',
+    'UPDATE recipes_recipe AS r SET search_vector = '
+    "setweight(to_tsvector('russian', r.name), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(("
+    + INGREDIENT_NAMES.format(aggregate="string_agg(i.name, ' ')")
+    + "), '')), 'B') || "
+    "setweight(to_tsvector('russian', r.text), 'C')",
+)
+POSTGRES_BACKWARD = (
+    'DROP INDEX recipes_recipe_search_vector',
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+)
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE recipes_recipe_fts USING '
+    "fts5(name, ingredients, text, tokenize='unicode61')",
+    'INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) '
+    'SELECT r.id, r.name, coalesce(('
+    + INGREDIENT_NAMES.format(aggregate="group_concat(i.name, ' ')")
+    + "), ''), r.text FROM recipes_recipe AS r",
+)
+SQLITE_BACKWARD = (
+    'DROP TABLE recipes_recipe_fts',
+)
+
+
+def run(statements):
+    # Other backends have no search storage and use icontains lookups.
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_BACKWARD,
+                 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
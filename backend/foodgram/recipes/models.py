@@ -1,5 +1,6 @@
 from django.core import validators
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
 from users.models import User
 
 
@@ -46,6 +47,36 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        if user.is_authenticated:
+            is_favorited = Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            is_in_shopping_cart = Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, author=OuterRef('pk')))
+        else:
+            is_favorited = is_in_shopping_cart = is_subscribed = Value(
+                False, output_field=models.BooleanField())
+        return self.annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        ).prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=is_subscribed)
+            ),
+            'tags',
+            Prefetch(
+                'ingredient_number',
+                queryset=IngredientNumber.objects.select_related(
+                    'ingredient').order_by('id')
+            ),
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='recipes', blank=False)
@@ -54,6 +85,7 @@ class Recipe(models.Model):
         upload_to='recipes/', null=True,
         blank=False
     )
+    image_thumbnails = models.JSONField(default=dict, editable=False)
     text = models.TextField(blank=False)
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -68,9 +100,25 @@ class Recipe(models.Model):
             validators.MinValueValidator(1),
         )
     )
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0, editable=False)
+    popularity = models.PositiveIntegerField(default=0, editable=False)
+    trending_score = models.FloatField(default=0, editable=False)
+    in_timelines = models.BooleanField(default=False, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Recipe'
+        indexes = [
+            models.Index(fields=['author', '-id'], name='recipe_author_idx'),
+            models.Index(
+                fields=['-popularity', '-id'], name='recipe_popularity_idx'),
+            models.Index(
+                fields=['-trending_score', '-id'], name='recipe_trending_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -101,11 +149,35 @@ class Follow(UserFollow):
                 fields=['user', 'author'],
             ),
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_author_idx'),
+        ]
 
     def __str__(self):
         return self.author
 
 
+class TimelineEntry(models.Model):
+    """A recipe fanned out to the feed of one follower of its author."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_timeline_entry')
+        ]
+
+
 class IngredientNumber(models.Model):
     ingredient = models.ForeignKey(
         Ingredient,
@@ -130,6 +202,12 @@ class IngredientNumber(models.Model):
             models.UniqueConstraint(fields=['ingredient', 'recipe'],
                                     name='ingredient_number')
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient', 'number'],
+                name='ingredientnumber_recipe_idx',
+            ),
+        ]
 
 
 class Favorite(models.Model):
@@ -143,6 +221,7 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         related_name='favorite',
     )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -165,9 +244,40 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         related_name='shopping_cart',
     )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_shopping_cart')
         ]
+
+
+class ShoppingListExport(models.Model):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_exports',
+    )
+    digest = models.CharField(max_length=64)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    file = models.FileField(upload_to='shopping_lists/', null=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'digest'],
+                                    name='unique_shopping_list_export')
+        ]
+
+    def __str__(self):
+        return f'Список покупок {self.user} ({self.status})'
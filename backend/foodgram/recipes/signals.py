@@ -0,0 +1,164 @@
+import threading
+from collections import defaultdict
+
+from django.apps import apps
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from . import fulltext, trending
+from .counters import COUNTERS, change_counter
+
+# Primary keys of counted rows being deleted, by model label. The rows
+# deleted with them in a cascade skip the counter updates of a row that
+# is about to be gone.
+state = threading.local()
+
+
+def deleting(model):
+    if not hasattr(state, 'deleting'):
+        state.deleting = defaultdict(dict)
+    return state.deleting[model._meta.label]
+
+
+def being_deleted(model, pk):
+    using, clear = deleting(model).get(pk, (None, None))
+    if clear is None:
+        return False
+    # A delete that raised never sends post_delete, but its transaction
+    # rolls back and drops the mark's on_commit callback with it.
+    if any(entry[1] is clear for entry in connections[using].run_on_commit):
+        return True
+    deleting(model).pop(pk, None)
+    return False
+
+
+def connect_deletions():
+
+    def started(sender, instance, using, **kwargs):
+        marks = deleting(sender)
+        pk = instance.pk
+
+        def clear():
+            if marks.get(pk, (None, None))[1] is clear:
+                del marks[pk]
+
+        marks[pk] = (using, clear)
+        transaction.on_commit(clear, using=using)
+
+    def finished(sender, instance, **kwargs):
+        deleting(sender).pop(instance.pk, None)
+
+    for label in {target for _, _, target, _ in COUNTERS}:
+        model = apps.get_model(label)
+        pre_delete.connect(
+            started, sender=model, weak=False,
+            dispatch_uid=f'{label}_deleting')
+        post_delete.connect(
+            finished, sender=model, weak=False,
+            dispatch_uid=f'{label}_deleted')
+
+
+def connect_counter(source, foreign_key, target, field):
+    source = apps.get_model(source)
+    target = apps.get_model(target)
+    attname = source._meta.get_field(foreign_key).attname
+
+    def increment(instance, created, raw=False, **kwargs):
+        if created and not raw:
+            change_counter(target, getattr(instance, attname), field, 1)
+
+    def decrement(instance, **kwargs):
+        pk = getattr(instance, attname)
+        if not being_deleted(target, pk):
+            change_counter(target, pk, field, -1)
+
+    post_save.connect(
+        increment, sender=source, weak=False,
+        dispatch_uid=f'{field}_increment')
+    post_delete.connect(
+        decrement, sender=source, weak=False,
+        dispatch_uid=f'{field}_decrement')
+
+
+def connect_counters():
+    connect_deletions()
+    for counter in COUNTERS:
+        connect_counter(*counter)
+
+
+def connect_trending():
+    recipe = apps.get_model('recipes.Recipe')
+
+    # Stored scores do not decay between recompute runs, so an event
+    # counts with its weight at creation until the next run; a removal
+    # takes back exactly that weight.
+    def weight(instance):
+        return trending.event_weight(
+            instance.created_at, now=instance.created_at)
+
+    def added(instance, created, raw=False, **kwargs):
+        if created and not raw:
+            change_counter(
+                recipe, instance.recipe_id, 'trending_score',
+                weight(instance))
+
+    def removed(instance, **kwargs):
+        if not being_deleted(recipe, instance.recipe_id):
+            change_counter(
+                recipe, instance.recipe_id, 'trending_score',
+                -weight(instance))
+
+    for source in trending.SOURCES:
+        source = apps.get_model(source)
+        post_save.connect(
+            added, sender=source, weak=False,
+            dispatch_uid=f'trending_{source.__name__}_added')
+        post_delete.connect(
+            removed, sender=source, weak=False,
+            dispatch_uid=f'trending_{source.__name__}_removed')
+
+
+def refresh_search(recipe_ids, using):
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(
+        lambda: fulltext.refresh(recipe_ids, using), using=using)
+
+
+def connect_search():
+    recipe = apps.get_model('recipes.Recipe')
+    ingredient = apps.get_model('recipes.Ingredient')
+    ingredient_number = apps.get_model('recipes.IngredientNumber')
+
+    def recipe_changed(instance, using, raw=False, **kwargs):
+        if not raw:
+            refresh_search((instance.pk,), using)
+
+    def amount_changed(instance, using, raw=False, **kwargs):
+        # A deleted recipe is refreshed once by recipe_changed.
+        if not raw and not being_deleted(recipe, instance.recipe_id):
+            refresh_search((instance.recipe_id,), using)
+
+    def ingredient_changed(instance, using, raw=False, **kwargs):
+        if not raw:
+            refresh_search(
+                ingredient_number.objects.using(using)
+                .filter(ingredient=instance)
+                .values_list('recipe_id', flat=True),
+                using,
+            )
+
+    post_save.connect(
+        recipe_changed, sender=recipe, weak=False,
+        dispatch_uid='search_recipe_saved')
+    post_delete.connect(
+        recipe_changed, sender=recipe, weak=False,
+        dispatch_uid='search_recipe_deleted')
+    post_save.connect(
+        amount_changed, sender=ingredient_number, weak=False,
+        dispatch_uid='search_amount_saved')
+    post_delete.connect(
+        amount_changed, sender=ingredient_number, weak=False,
+        dispatch_uid='search_amount_deleted')
+    post_save.connect(
+        ingredient_changed, sender=ingredient, weak=False,
+        dispatch_uid='search_ingredient_changed')
@@ -0,0 +1,88 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+HALF_LIFE = getattr(settings, 'TRENDING_HALF_LIFE', 24 * 60 * 60)
+# Upper bounds of the rolling windows by event age, in seconds. Events
+# older than the last one no longer count.
+WINDOWS = getattr(settings, 'TRENDING_WINDOWS', (
+    60 * 60, 6 * 60 * 60, 24 * 60 * 60, 3 * 24 * 60 * 60, 7 * 24 * 60 * 60,
+))
+# Events that make a recipe trend, each with a ``recipe`` foreign key.
+SOURCES = ('recipes.Favorite', 'recipes.ShoppingCart')
+
+
+def window_bounds():
+    lower = 0
+    for upper in WINDOWS:
+        yield lower, upper
+        lower = upper
+
+
+def window_weight(lower):
+    """Weight of the events in a window, halved every ``HALF_LIFE``."""
+    return 0.5 ** (lower / HALF_LIFE)
+
+
+def event_weight(created_at, now=None):
+    age = ((now or timezone.now()) - created_at).total_seconds()
+    for lower, upper in window_bounds():
+        if age < upper:
+            return window_weight(lower)
+    return 0.0
+
+
+def in_window(now, lower, upper):
+    condition = Q(created_at__gt=now - timedelta(seconds=upper))
+    if lower:
+        condition &= Q(created_at__lte=now - timedelta(seconds=lower))
+    return condition
+
+
+def trending_scores(apps=global_apps, now=None):
+    """Return the time-decayed score of every recipe with recent events.
+
+    Each source is read in one grouped query that counts the events of a
+    recipe per window; a window weighs as much as its youngest event.
+    """
+    now = now or timezone.now()
+    bounds = list(window_bounds())
+    scores = defaultdict(float)
+    for source in SOURCES:
+        rows = apps.get_model(source).objects.filter(
+            created_at__gt=now - timedelta(seconds=WINDOWS[-1]),
+        ).order_by().values('recipe_id').annotate(**{
+            f'window_{number}': Count('pk', filter=in_window(now, *bound))
+            for number, bound in enumerate(bounds)
+        })
+        for row in rows:
+            scores[row['recipe_id']] += sum(
+                row[f'window_{number}'] * window_weight(lower)
+                for number, (lower, _) in enumerate(bounds)
+            )
+    return {pk: round(score, 6) for pk, score in scores.items()}
+
+
+def recompute(apps=global_apps, now=None, batch_size=1000):
+    """Rewrite ``Recipe.trending_score`` and return the changed row count.
+
+    Between runs the score only grows by the weight of new events and
+    shrinks by removed ones; this applies the decay and drops the events
+    that left the last window.
+    """
+    recipe = apps.get_model('recipes.Recipe')
+    current = dict(recipe.objects.filter(
+        trending_score__gt=0).values_list('pk', 'trending_score'))
+    changed = [
+        recipe(pk=pk, trending_score=score)
+        for pk, score in trending_scores(apps, now).items()
+        if current.pop(pk, 0) != score
+    ]
+    changed.extend(recipe(pk=pk, trending_score=0) for pk in current)
+    recipe.objects.bulk_update(
+        changed, ('trending_score',), batch_size=batch_size)
+    return len(changed)